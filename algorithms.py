@@ -1,22 +1,134 @@
+import bisect
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import copy
+from itertools import count
+import math
+import statistics
+import multiprocessing
 from random import choice, seed
 import random
-from structs import TimetableNode
+import sys
+import time
+from search_log import SearchLog, DEBUG
+from structs import (
+    ConstraintManager,
+    TimetableNode,
+    count_pause_violations,
+    instrument_timetable_node,
+)
+from utils import MATERII
 import heapq
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class SearchProgress:
+    """Tracks the wall clock budget of a search and the best cost found so far"""
+
+    def __init__(self, time_limit=None):
+        """Constructor for the SearchProgress class, time_limit is in seconds"""
+        self.time_limit = time_limit
+        # Wall clock time, so the deadline is the same in the worker processes
+        self.start_time = time.time()
+        self.deadline = None if time_limit is None else self.start_time + time_limit
+        self.elapsed_time = 0.0
+        self.timed_out = False
+
+        # Best cost found so far and when it was reached (seconds from start and search step)
+        self.best_cost = float("inf")
+        self.best_cost_time = None
+        self.best_cost_step = None
+
+    def elapsed(self):
+        """Returns the number of seconds since the search started"""
+        return time.time() - self.start_time
+
+    def expired(self):
+        """Returns True if the time budget is used up"""
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.timed_out = True
+        return self.timed_out
+
+    def improve(self, cost, step):
+        """Records the cost if it is the best so far, returns True if it was"""
+        if cost >= self.best_cost:
+            return False
+
+        self.best_cost = cost
+        self.best_cost_time = self.elapsed()
+        self.best_cost_step = step
+        return True
+
+    def finish(self):
+        """Stops the clock of the search"""
+        self.elapsed_time = self.elapsed()
+
+
+# Hill climbing instance and stop event shared by the restarts running in a worker process
+_worker_hill_climbing = None
+_worker_stop_event = None
+
+
+def _init_restart_worker(hill_climbing, stop_event):
+    """Initializes a worker process of the parallel random restarts"""
+    global _worker_hill_climbing, _worker_stop_event
+    _worker_hill_climbing = hill_climbing
+    _worker_stop_event = stop_event
+
+    if hill_climbing.metrics.enabled:
+        instrument_timetable_node()
+
+
+def _run_restart(restart_seed):
+    """Runs one restart of the hill climbing in a worker process, returns its metrics as well"""
+    metrics = _worker_hill_climbing.metrics
+    metrics.reset()
+
+    iterations, solution = _worker_hill_climbing.hill_climbing(
+        _worker_hill_climbing.init_state_base.clone(), restart_seed, _worker_stop_event
+    )
+    return iterations, solution, metrics
+
 
 class RandomRestartHillClimbing:
     """Class that implements the hill climbing algorithm with random restarts"""
 
-    def __init__(self, max_restarts, max_iterations, initial_state: TimetableNode):
+    def __init__(
+        self,
+        max_restarts,
+        max_iterations,
+        initial_state: TimetableNode,
+        vectorized_scoring=False,
+        workers=1,
+        time_limit=None,
+        log=None,
+    ):
         """Constructor for the RandomRestartHillClimbing class"""
         self.max_restarts = max_restarts
         self.max_iterations = max_iterations
+        # Score all the moves of an iteration in one numpy pass instead of one by one
+        self.vectorized_scoring = vectorized_scoring
+        # Number of processes running restarts in parallel
+        self.workers = workers
+        # Time budget in seconds, the best solution so far is returned when it expires
+        self.time_limit = time_limit
+        self.progress = SearchProgress(time_limit)
+        self.metrics = initial_state.metrics
+        self.log = log if log is not None else SearchLog()
+        self.total_iterations = 0
         self.initial_state = initial_state
         self.init_state_base = initial_state.clone()
         self.seeds = [42, 69, 420, 666, 1337, 9001, 80085, 8008135, 80081355, 800813555]
 
     def random_restart_hill_climbing(self):
         """Driver function for the random restart hill climbing algorithm"""
+        self.progress = SearchProgress(self.time_limit)
+        if self.workers > 1:
+            return self.parallel_random_restart_hill_climbing()
+
         best_solution = None
         best_evaluation = float("inf")
         total_iterations = 0
@@ -35,65 +147,276 @@ class RandomRestartHillClimbing:
             if current_evaluation <= best_evaluation:
                 best_evaluation = current_evaluation
                 best_solution = solution
+                self.progress.improve(current_evaluation, total_iterations)
+
+            if self.log.due():
+                self.log.progress(
+                    "restart",
+                    restart=number_of_restarts,
+                    iterations=total_iterations,
+                    evaluation=current_evaluation,
+                    best=best_evaluation,
+                    elapsed=round(self.progress.elapsed(), 2),
+                )
 
-            if solution.eval_node() == 0:
-                print("Solution found faster than programmed restarts!")
-                print("Students not assigned per activity: ")
-                print(solution.students_per_activity)
+            if self.progress.expired():
+                self.log.info("Time limit reached, returning the best solution so far")
+                break
+
+            if current_evaluation == 0:
+                self.log.info("Solution found faster than programmed restarts!")
+                self.log.info("Students not assigned per activity: ")
+                self.log.info(solution.students_per_activity)
                 break
 
             number_of_restarts += 1
 
-        print(
+        self.progress.finish()
+        self.log.info(
+            f"Number of students not assigned: {best_solution.get_remaining_students()}"
+        )
+        self.log.info(f"Number of restarts: {number_of_restarts}")
+        self.total_iterations = total_iterations
+        return best_solution, total_iterations
+
+    def restart_seed(self, restart_idx):
+        """Returns the deterministic seed of a restart in parallel mode"""
+        return self.seeds[restart_idx % len(self.seeds)] + restart_idx // len(self.seeds)
+
+    def parallel_random_restart_hill_climbing(self):
+        """Runs the restarts on a process pool and keeps the best solution"""
+        best_solution = None
+        best_evaluation = float("inf")
+        best_restart_idx = None
+        total_iterations = 0
+        number_of_restarts = 0
+
+        with multiprocessing.Manager() as manager:
+            # Set once a restart finds a perfect solution, so the other workers stop
+            stop_event = manager.Event()
+
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_restart_worker,
+                initargs=(self, stop_event),
+            ) as executor:
+                futures = {
+                    executor.submit(_run_restart, self.restart_seed(restart_idx)): restart_idx
+                    for restart_idx in range(self.max_restarts)
+                }
+
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+
+                    iterations, solution, worker_metrics = future.result()
+                    self.metrics.merge(worker_metrics)
+                    restart_idx = futures[future]
+                    total_iterations += iterations
+                    number_of_restarts += 1
+
+                    # On equal evaluations keep the earliest restart, so the result is deterministic
+                    current_evaluation = solution.eval_node()
+                    if best_solution is None or (current_evaluation, restart_idx) < (
+                        best_evaluation,
+                        best_restart_idx,
+                    ):
+                        best_evaluation = current_evaluation
+                        best_solution = solution
+                        best_restart_idx = restart_idx
+                        self.progress.improve(current_evaluation, total_iterations)
+
+                    if self.log.due():
+                        self.log.progress(
+                            "restart",
+                            restart=restart_idx,
+                            iterations=total_iterations,
+                            evaluation=current_evaluation,
+                            best=best_evaluation,
+                            elapsed=round(self.progress.elapsed(), 2),
+                        )
+
+                    # Restarts that haven't started yet are dropped when the time is up
+                    if self.progress.expired() and not stop_event.is_set():
+                        self.log.info("Time limit reached, returning the best solution so far")
+                        stop_event.set()
+                        for other_future in futures:
+                            other_future.cancel()
+
+                    if current_evaluation == 0 and not stop_event.is_set():
+                        self.log.info("Solution found faster than programmed restarts!")
+                        self.log.info("Students not assigned per activity: ")
+                        self.log.info(solution.students_per_activity)
+                        stop_event.set()
+                        for other_future in futures:
+                            other_future.cancel()
+
+        self.progress.finish()
+        self.log.info(
             f"Number of students not assigned: {best_solution.get_remaining_students()}"
         )
-        print(f"Number of restarts: {number_of_restarts}")
+        self.log.info(f"Number of restarts: {number_of_restarts}")
+        self.total_iterations = total_iterations
         return best_solution, total_iterations
 
-    def hill_climbing(self, initial_state):
+    def hill_climbing(self, initial_state, restart_seed=None, stop_event=None):
         """Actual hill climbing algorithm used within each restart"""
         iterations = 0
         current_state = initial_state
 
+        # Restarts with their own seed are reproducible
+        if restart_seed is not None:
+            random.seed(restart_seed)
+        seed = restart_seed
+        start_time = time.perf_counter()
+
         while iterations < self.max_iterations:
+            # Another restart already found a perfect solution or the time is up
+            if stop_event is not None and stop_event.is_set():
+                break
+            if self.progress.expired():
+                break
+
             iterations += 1
 
-            neighbors = current_state.get_next_states()
+            # Moves are scored from their cost delta, only the chosen one becomes a node
+            moves = current_state.get_next_moves()
 
-            if not neighbors:
+            if not moves:
                 break
 
             if iterations == 1:
-                seed = choice(self.seeds)
+                seed = choice(self.seeds) if restart_seed is None else restart_seed
                 random.seed(seed)
-                print("First iteration with seed: ", seed)
-                random.shuffle(neighbors)
+                self.log.debug("restart_seed", seed=seed)
+                random.shuffle(moves)
                 random.shuffle(self.seeds)
-                best_neighbor = neighbors[0]
+                best_move = moves[0]
+            elif self.vectorized_scoring:
+                best_move = moves[int(current_state.eval_moves(moves).argmin())]
             else:
-                best_neighbor = min(neighbors, key=lambda x: x.eval_node())
+                best_move = min(moves, key=current_state.eval_move)
 
-            if (
-                best_neighbor.get_remaining_students()
-                >= current_state.get_remaining_students()
-            ):
+            # Stop if the best move doesn't assign any more students
+            if best_move.covered_students <= 0:
                 break
 
-            current_state = best_neighbor
+            current_state = current_state.choose_move(best_move)
             current_state.apply_assignment_on_best_node()
 
+            if self.log.level >= DEBUG:
+                self.log.debug(
+                    "iteration",
+                    seed=seed,
+                    iteration=iterations,
+                    remaining_students=current_state.get_remaining_students,
+                    evaluation=current_state.eval_node,
+                )
+
+        self.metrics.record_restart(
+            seed=seed,
+            iterations=iterations,
+            evaluation=current_state.eval_node(),
+            remaining_students=current_state.get_remaining_students(),
+            time=round(time.perf_counter() - start_time, 4),
+        )
         return iterations, current_state
 
 
+def estimate_size(obj, seen=None):
+    """Returns the approximate number of bytes of an object and of the containers it holds.
+
+    Strings and the constraints manager are shared by all the nodes, they aren't counted.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, (str, ConstraintManager)):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = list(obj.keys()) + list(obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = obj
+    elif hasattr(obj, "__dict__"):
+        items = vars(obj).values()
+    else:
+        return size
+    return size + sum(estimate_size(item, seen) for item in items)
+
+
+def peak_resident_memory():
+    """Returns the peak resident memory of the process in bytes, or None if it can't be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
 class AStarSearch:
-    def __init__(self, initial_state):
+    """A* search over partial timetables.
+
+    The open set can be bounded by a number of entries (max_open_nodes) or by an
+    estimate of the bytes they keep alive (memory_budget). When a bound is exceeded
+    the entries with the highest f are dropped, down to PRUNE_TARGET of the bound,
+    and their parent remembers the best f it forgot (SMA* style): once the parent
+    has no entry left in the open set it is queued again with that f, so the
+    forgotten successors are generated again if they become the most promising.
+    A parent queued again that is dropped in turn backs its f up to its own parent.
+    The search tree is only tracked when a bound is set. The nodes still referenced
+    by the open set can't be dropped, so when they alone exceed the memory budget the
+    search goes on and reports that the budget was exceeded.
+    """
+
+    # Fraction of the bounds the open set is brought back to when it is pruned
+    PRUNE_TARGET = 0.75
+
+    def __init__(
+        self,
+        initial_state,
+        time_limit=None,
+        log=None,
+        max_open_nodes=None,
+        memory_budget=None,
+    ):
         self.initial_state = initial_state
+        self.metrics = initial_state.metrics
+        self.log = log if log is not None else SearchLog()
+        # Time budget in seconds, the best node so far is returned when it expires
+        self.time_limit = time_limit
+        self.progress = SearchProgress(time_limit)
+        # Bounds of the open set, in entries and in estimated bytes
+        self.max_open_nodes = max_open_nodes
+        self.memory_budget = memory_budget
+        self.bounded = max_open_nodes is not None or memory_budget is not None
 
     def search(self):
-        explored_nodes = 0
-        expanded_nodes = 0
+        self.progress = SearchProgress(self.time_limit)
+        best_node = self.initial_state
+        self.explored_nodes = 0
+        self.expanded_nodes = 0
+        self.pruned_nodes = 0
+        self.dropped_nodes = 0
+        self.peak_open_nodes = 0
+        self.peak_open_bytes = 0
+        self.budget_exceeded = False
         open_set = []
+
+        # Search tree kept in memory: references to every node (open set entries with it
+        # as their parent or queuing it again, and its children in the tree), the parent
+        # of every node and the best f forgotten by the nodes
+        self.node_references = {}
+        self.parents = {}
+        self.forgotten_costs = {}
+        # Estimated bytes of an open set entry and of a node it keeps alive
+        self.entry_bytes = None
+        self.node_bytes = estimate_size(self.initial_state)
+
+        # Zobrist hashes of the expanded nodes and of the nodes waiting in the open set
         closed_set = set()
+        open_hashes = set()
         
         # Store the state with the least remaining students
         best_so_far = (
@@ -105,25 +428,71 @@ class AStarSearch:
         stagnation_counter = 0
         max_stagnation = 25
 
-        heapq.heappush(open_set, (self.initial_state.total_cost(), self.initial_state))
+        # Open set entries are (f, remaining students, counter, parent, move), the state of
+        # an entry is only built from its parent when it is popped
+        self.tie_breaker = count()
+        self.push(
+            open_set,
+            (
+                self.initial_state.total_cost(),
+                self.initial_state.get_remaining_students(),
+                next(self.tie_breaker),
+                self.initial_state,
+                None,
+            ),
+        )
+        open_hashes.add(self.initial_state.zobrist_hash)
 
         while open_set:
-            explored_nodes += 1
-            _, current_node = heapq.heappop(open_set)
+            self.explored_nodes += 1
+            with self.metrics.timer("heap_pop"):
+                entry = heapq.heappop(open_set)
+            _, _, _, parent, move = entry
+            current_node = parent if move is None else parent.apply_move(move)
+            open_hashes.discard(current_node.zobrist_hash)
+            # A node queued again generates its forgotten successors now
+            if move is None:
+                self.forgotten_costs.pop(current_node.zobrist_hash, None)
             remaining_students = current_node.get_remaining_students()
 
-            print(f"Remaining students: {remaining_students}")
-            print(f"Current g: {current_node.g()}")
-            print(f"Current h: {current_node.h()}")
+            # Keep the node with the best heuristic for when the time runs out
+            if self.progress.improve(current_node.h(), self.explored_nodes):
+                best_node = current_node
+
+            # g and h are full scans of the timetable, they are only computed when printed
+            if self.log.level >= DEBUG:
+                self.log.debug(
+                    "node",
+                    explored=self.explored_nodes,
+                    remaining_students=remaining_students,
+                    g=current_node.g,
+                    h=current_node.h,
+                )
+            elif self.log.due():
+                self.log.progress(
+                    "astar",
+                    explored=self.explored_nodes,
+                    expanded=self.expanded_nodes,
+                    open_set=len(open_set),
+                    remaining_students=remaining_students,
+                    best_h=self.progress.best_cost,
+                    elapsed=round(self.progress.elapsed(), 2),
+                )
 
             if remaining_students == 0:
-                print("Solution found!")
-                print("Students not assigned per activity: ")
-                print(current_node.students_per_activity)
-                print(f"Explored nodes: {explored_nodes}")
-                print(f"Expanded nodes: {expanded_nodes}")
+                self.log.info("Solution found!")
+                self.log.info("Students not assigned per activity: ")
+                self.log.info(current_node.students_per_activity)
+                self.print_counters()
+                self.progress.finish()
                 return current_node
 
+            if self.progress.expired():
+                self.log.info("Time limit reached, returning the best node so far")
+                self.print_counters()
+                self.progress.finish()
+                return best_node
+
             # Check if we have found a new best state
             if remaining_students < best_so_far[0]:
                 best_so_far = (remaining_students, current_node)
@@ -131,26 +500,1623 @@ class AStarSearch:
             else:
                 stagnation_counter += 1
 
+            # Successors link the node to the parent it was built from in the search tree,
+            # a node queued again is already linked
+            tree_parent = None if move is None else parent
+
             # If stagnation is too high, backtrack
             if stagnation_counter >= max_stagnation:
-                print(
-                    "Stagnation detected. Backtracking to best state so far with fewer remaining students."
+                self.log.debug(
+                    "stagnation", backtrack_to=best_so_far[0], explored=self.explored_nodes
                 )
                 current_node = best_so_far[1]
+                tree_parent = None
                 stagnation_counter = 0
 
-            closed_set.add(current_node)
-            neighbors = current_node.get_next_states()
+            closed_set.add(current_node.zobrist_hash)
+            moves = current_node.get_next_moves()
+
+            for move in moves:
+                self.expanded_nodes += 1
+
+                # Skip timetables that were already expanded or are already waiting in the open set
+                neighbor_hash = current_node.move_hash(move)
+                if neighbor_hash in closed_set or neighbor_hash in open_hashes:
+                    self.pruned_nodes += 1
+                    continue
+
+                with self.metrics.timer("heap_push"):
+                    self.push(
+                        open_set,
+                        (
+                            current_node.move_total_cost(move),
+                            current_node.get_remaining_students() - move.covered_students,
+                            next(self.tie_breaker),
+                            current_node,
+                            move,
+                        ),
+                        tree_parent,
+                    )
+                open_hashes.add(neighbor_hash)
+
+                if self.bounded and self.over_bounds(len(open_set)):
+                    self.prune(open_set, open_hashes, closed_set)
+
+            # The popped entry only lets go of its node once the successors hold it
+            if self.bounded:
+                self.release(open_set, parent)
+
+            if self.metrics.enabled:
+                self.metrics.record_expansion(
+                    expansion=self.explored_nodes,
+                    g=current_node.g(),
+                    h=current_node.h(),
+                    remaining_students=current_node.get_remaining_students(),
+                    successors=len(moves),
+                    open_set_size=len(open_set),
+                )
+
+        self.log.info("Open set exhausted, returning the best node so far")
+        self.print_counters()
+        self.progress.finish()
+        return best_node
+
+    def open_set_bytes(self, entries):
+        """Returns the estimated bytes of an open set: its entries and the nodes they keep alive"""
+        return entries * (self.entry_bytes or 0) + len(self.node_references) * self.node_bytes
+
+    def over_bounds(self, entries, ratio=1.0):
+        """Returns True if an open set with this many entries exceeds a fraction of the bounds"""
+        if self.max_open_nodes is not None and entries > self.max_open_nodes * ratio:
+            return True
+        return (
+            self.memory_budget is not None
+            and self.open_set_bytes(entries) > self.memory_budget * ratio
+        )
+
+    def push(self, open_set, entry, parent=None):
+        """Pushes an entry on the open set, counting the node it references when the open set is bounded"""
+        heapq.heappush(open_set, entry)
+        if len(open_set) > self.peak_open_nodes:
+            self.peak_open_nodes = len(open_set)
+        if not self.bounded:
+            return
+
+        if self.entry_bytes is None:
+            # Entries only differ by their numbers, the first one is measured
+            self.entry_bytes = estimate_size(entry[:3] + (None, entry[4]))
+        self.hold(entry[3], parent)
+        self.peak_open_bytes = max(
+            self.peak_open_bytes, self.open_set_bytes(len(open_set))
+        )
+
+    def hold(self, node, parent=None):
+        """Counts a reference to a node, linking it to its parent when it enters the search tree"""
+        node_hash = node.zobrist_hash
+        if node_hash not in self.node_references:
+            self.node_references[node_hash] = 0
+            if parent is not None:
+                self.parents[node_hash] = parent
+                self.hold(parent)
+        self.node_references[node_hash] += 1
+
+    def release(self, open_set, node, requeued=None):
+        """Uncounts a reference to a node.
+
+        A node left without references leaves the search tree and releases its parent,
+        unless it forgot successors: then it is queued again with the best f it forgot
+        (or appended to requeued, for the caller to queue it).
+        """
+        while node is not None:
+            node_hash = node.zobrist_hash
+            self.node_references[node_hash] -= 1
+            if self.node_references[node_hash]:
+                return
+
+            if node_hash in self.forgotten_costs:
+                entry = (
+                    self.forgotten_costs[node_hash],
+                    node.get_remaining_students(),
+                    next(self.tie_breaker),
+                    node,
+                    None,
+                )
+                if requeued is None:
+                    self.push(open_set, entry)
+                else:
+                    self.hold(node)
+                    requeued.append(entry)
+                return
+
+            del self.node_references[node_hash]
+            node = self.parents.pop(node_hash, None)
+
+    def prune(self, open_set, open_hashes, closed_set):
+        """Drops the entries with the highest f until the open set is back under PRUNE_TARGET of its bounds"""
+        open_set.sort()
+        requeued = []
+        while len(open_set) > 1 and self.over_bounds(len(open_set), self.PRUNE_TARGET):
+            cost, _, _, node, move = open_set.pop()
+            self.dropped_nodes += 1
+            node_hash = node.zobrist_hash
+
+            if move is None:
+                # A node queued again is dropped with all the successors it forgot, its
+                # parent remembers their best f and generates the node again from it
+                self.forgotten_costs.pop(node_hash, None)
+                forgetting = self.parents.get(node_hash)
+                closed_set.discard(node_hash)
+            else:
+                open_hashes.discard(node.move_hash(move))
+                forgetting = node
+
+            if forgetting is not None:
+                forgetting_hash = forgetting.zobrist_hash
+                self.forgotten_costs[forgetting_hash] = min(
+                    cost, self.forgotten_costs.get(forgetting_hash, cost)
+                )
+            self.release(open_set, node, requeued)
+
+        heapq.heapify(open_set)
+        # Nodes with all their successors dropped wait in the open set with the best f they forgot
+        for entry in requeued:
+            heapq.heappush(open_set, entry)
+        # The nodes the last entries keep alive don't fit in the budget
+        if self.over_bounds(len(open_set)):
+            self.budget_exceeded = True
+        self.log.debug(
+            "prune",
+            open_set=len(open_set),
+            dropped=self.dropped_nodes,
+            open_bytes=self.open_set_bytes(len(open_set)),
+        )
+
+    def print_counters(self):
+        """Prints the node counters of the search"""
+        self.log.info(f"Explored nodes: {self.explored_nodes}")
+        self.log.info(f"Expanded nodes: {self.expanded_nodes}")
+        self.log.info(f"Pruned duplicates: {self.pruned_nodes}")
+        if not self.bounded:
+            self.log.info(f"Peak open set: {self.peak_open_nodes} entries")
+        else:
+            self.log.info(f"Dropped nodes (memory bound): {self.dropped_nodes}")
+            self.log.info(
+                f"Peak open set: {self.peak_open_nodes} entries "
+                f"(~{self.peak_open_bytes / 2**20:.2f} MiB estimated)"
+            )
+        if self.budget_exceeded:
+            self.log.info(
+                "Memory budget exceeded: the nodes kept alive by the open set don't fit in it"
+            )
+        peak_memory = peak_resident_memory()
+        if peak_memory is not None:
+            self.log.info(f"Peak resident memory: {peak_memory / 2**20:.2f} MiB")
+
+
+# Constraints manager and metrics shared by the beam nodes expanded in a worker process
+_worker_constraints_manager = None
+_worker_metrics = None
+
+
+def _init_beam_worker(constraints_manager, metrics):
+    """Initializes a worker process of the beam search"""
+    global _worker_constraints_manager, _worker_metrics
+    _worker_constraints_manager = constraints_manager
+    _worker_metrics = metrics
+
+    if metrics.enabled:
+        instrument_timetable_node()
+
+
+def best_unique_successors(successors, width):
+    """Merges the successors reaching the same timetable and returns the `width` best, with the number of merged duplicates.
+
+    Successors are tuples starting with (f, remaining students, hash), the best of
+    the successors sharing a hash is kept.
+    """
+    unique_successors = {}
+    for successor in successors:
+        neighbor_hash = successor[2]
+        if (
+            neighbor_hash not in unique_successors
+            or successor[:2] < unique_successors[neighbor_hash][:2]
+        ):
+            unique_successors[neighbor_hash] = successor
+
+    best = heapq.nsmallest(
+        width, unique_successors.values(), key=lambda successor: successor[:2]
+    )
+    return best, len(successors) - len(unique_successors)
+
+
+def beam_successors(node, width):
+    """Expands a beam node, returns its best successors as (f, remaining students, hash, move) tuples, the number of
+    successors and the number of duplicates"""
+    successors = [
+        (
+            node.move_total_cost(move),
+            node.get_remaining_students() - move.covered_students,
+            node.move_hash(move),
+            move,
+        )
+        for move in node.get_next_moves()
+    ]
+    # Only the best successors of a node can make it into the beam, the others aren't sent back
+    best, duplicates = best_unique_successors(successors, width)
+    return best, len(successors), duplicates
+
+
+def _expand_beam_node(node_state, expansion_seed, width):
+    """Expands a beam node sent as its state to a worker process, returns its best successors, the number of
+    successors, the number of duplicates and the metrics of the expansion"""
+    node = TimetableNode(_worker_constraints_manager, *node_state, _worker_metrics)
+    # The moves of a node are partly random, the seed keeps them the same on any worker
+    random.seed(expansion_seed)
+    # The metrics are a copy owned by the worker, they are merged by the main process
+    metrics = node.metrics
+    metrics.reset()
+    return (*beam_successors(node, width), metrics)
+
+
+class BeamSearch:
+    """Beam search over partial timetables, between the hill climbing and A*.
+
+    Every depth adds one assignment: the nodes of the beam are expanded, on a process
+    pool when there are several workers, the successors reaching the same timetable
+    are merged by Zobrist hash and only the `width` successors with the best A* cost
+    are kept. The memory used is bounded by the width instead of growing like the
+    A* open set.
+    """
+
+    def __init__(
+        self,
+        initial_state: TimetableNode,
+        width=4,
+        workers=1,
+        time_limit=None,
+        log=None,
+    ):
+        """Constructor for the BeamSearch class"""
+        self.initial_state = initial_state
+        self.width = width
+        # Number of processes expanding the nodes of the beam in parallel
+        self.workers = workers
+        self.time_limit = time_limit
+        self.progress = SearchProgress(time_limit)
+        self.metrics = initial_state.metrics
+        self.log = log if log is not None else SearchLog()
+        self.total_iterations = 0
+
+    def search(self):
+        """Returns the first complete timetable found, or the best node if the beam runs out"""
+        self.progress = SearchProgress(self.time_limit)
+        self.expanded_nodes = 0
+        self.generated_nodes = 0
+        self.pruned_nodes = 0
+        self.depth = 0
+        # Draws the seeds of the expansions, it is seeded from the global random state
+        self.random = random.Random(random.randrange(2**32))
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_beam_worker,
+                initargs=(self.initial_state.constraints_manager, self.metrics),
+            ) as executor:
+                result = self.run(executor)
+        else:
+            result = self.run(None)
+
+        self.total_iterations = self.expanded_nodes
+        self.progress.finish()
+        self.log.info(f"Beam depth: {self.depth}")
+        self.log.info(f"Expanded nodes: {self.expanded_nodes}")
+        self.log.info(f"Generated nodes: {self.generated_nodes}")
+        self.log.info(f"Pruned duplicates: {self.pruned_nodes}")
+        self.log.info(
+            f"Number of students not assigned: {result.get_remaining_students()}"
+        )
+        return result
+
+    def expand(self, beam, executor):
+        """Returns the best successors of every node of the beam as (f, remaining students, hash, parent, move) tuples"""
+        seeds = [self.random.randrange(2**32) for _ in beam]
+        if executor is None:
+            expansions = map(self.expand_node, beam, seeds)
+        else:
+            # Only the state of the nodes is sent, the workers already have the constraints manager
+            states = [node.state() for node in beam]
+            widths = [self.width] * len(beam)
+            expansions = executor.map(_expand_beam_node, states, seeds, widths)
+
+        candidates = []
+        for parent, (successors, generated, duplicates, worker_metrics) in zip(
+            beam, expansions
+        ):
+            if worker_metrics is not None:
+                self.metrics.merge(worker_metrics)
+            self.generated_nodes += generated
+            self.pruned_nodes += duplicates
+            candidates.extend(
+                (cost, remaining_students, neighbor_hash, parent, move)
+                for cost, remaining_students, neighbor_hash, move in successors
+            )
+        return candidates
+
+    def expand_node(self, node, expansion_seed):
+        """Expands a beam node in this process, its calls are counted in the metrics of the search directly"""
+        # The global random state is seeded like a worker's and restored afterwards,
+        # so the expansions don't depend on the number of workers
+        random_state = random.getstate()
+        random.seed(expansion_seed)
+        try:
+            return (*beam_successors(node, self.width), None)
+        finally:
+            random.setstate(random_state)
+
+    def run(self, executor):
+        """Runs the beam search, expanding the beam with the executor if given"""
+        beam = [self.initial_state]
+        best_node = self.initial_state
+        self.progress.improve(best_node.h(), 0)
+
+        while beam:
+            if self.progress.expired():
+                self.log.info("Time limit reached, returning the best node so far")
+                return best_node
+
+            candidates = self.expand(beam, executor)
+            self.expanded_nodes += len(beam)
+            if not candidates:
+                break
+            self.depth += 1
+
+            # Successors of different nodes reaching the same timetable are merged as well
+            kept, duplicates = best_unique_successors(candidates, self.width)
+            self.pruned_nodes += duplicates
+            beam = [parent.apply_move(move) for _, _, _, parent, move in kept]
+
+            if self.progress.improve(beam[0].h(), self.depth):
+                best_node = beam[0]
+
+            if self.log.due():
+                self.log.progress(
+                    "beam",
+                    depth=self.depth,
+                    expanded=self.expanded_nodes,
+                    candidates=len(candidates) - duplicates,
+                    remaining_students=beam[0].get_remaining_students(),
+                    best_h=self.progress.best_cost,
+                    elapsed=round(self.progress.elapsed(), 2),
+                )
+
+            solutions = [node for node in beam if node.get_remaining_students() == 0]
+            if solutions:
+                self.log.info("Solution found!")
+                return solutions[0]
+
+        self.log.info("The beam ran out of successors, returning the best node")
+        return best_node
+
+
+def build_node_from_cells(initial_state: TimetableNode, cells):
+    """Returns the TimetableNode of a timetable given as (prof ID, activity ID) or None cells, indexed slot * rooms + room"""
+    constraints_manager = initial_state.constraints_manager
+    rooms_count = len(constraints_manager.rooms)
+    days = copy.deepcopy(initial_state.days)
+    professors = dict.fromkeys(constraints_manager.profs, 0)
+    students_per_activity = {
+        activity: constraints_manager.constraints[MATERII][activity]
+        for activity in constraints_manager.activities
+    }
+
+    for cell, assignment in enumerate(cells):
+        if assignment is None:
+            continue
+        prof = constraints_manager.profs[assignment[0]]
+        activity = constraints_manager.activities[assignment[1]]
+        day_name, interval_tuple = constraints_manager.slots[cell // rooms_count]
+        room = constraints_manager.rooms[cell % rooms_count]
+        days[day_name][interval_tuple][room] = (prof, activity)
+        professors[prof] += 1
+        students_per_activity[activity] = max(
+            0,
+            students_per_activity[activity] - constraints_manager.room_capacities[room],
+        )
+
+    return TimetableNode(
+        constraints_manager,
+        students_per_activity,
+        days,
+        professors,
+        metrics=initial_state.metrics,
+    )
+
+
+class CompleteTimetableSearch:
+    """Local search over complete timetables, shared by the tabu search and the simulated annealing.
+
+    The timetable is kept in a compact state: cells indexed slot * rooms + room with
+    (prof ID, activity ID) assignments, the professors and activities of every slot,
+    the slots of every professor, the covered students of every activity and the
+    running totals of the hill climbing evaluation. The moves relocate an assignment
+    to an empty cell, swap the assignments of two cells, change the professor of a
+    cell and, while some students are not covered, assign an empty cell. They are
+    returned as the list of (cell, new assignment) changes they make, and scored
+    from their cost delta with TimetableNode.evaluate, the cost used by eval_node.
+    """
+
+    RELOCATE = 0
+    SWAP = 1
+    CHANGE_PROF = 2
+    ASSIGN = 3
+
+    # Attempts at drawing a feasible random move before giving up
+    MAX_MOVE_TRIES = 20
+
+    def __init__(
+        self, initial_state: TimetableNode, max_iterations, time_limit=None, log=None
+    ):
+        """Constructor for the CompleteTimetableSearch class"""
+        self.initial_state = initial_state
+        self.max_iterations = max_iterations
+        self.time_limit = time_limit
+        self.progress = SearchProgress(time_limit)
+        self.metrics = initial_state.metrics
+        self.log = log if log is not None else SearchLog()
+        self.total_iterations = 0
+
+        constraints_manager = initial_state.constraints_manager
+        self.constraints_manager = constraints_manager
+        self.rooms_count = len(constraints_manager.rooms)
+        self.capacities = [
+            constraints_manager.room_capacities[room]
+            for room in constraints_manager.rooms
+        ]
+        self.needed_students = [
+            constraints_manager.constraints[MATERII][activity]
+            for activity in constraints_manager.activities
+        ]
+        self.room_activities = [
+            frozenset(
+                constraints_manager.activity_ids[activity]
+                for activity in constraints_manager.activities_per_room[room]
+            )
+            for room in constraints_manager.rooms
+        ]
+        self.activity_profs = [
+            [
+                constraints_manager.prof_ids[prof]
+                for prof in constraints_manager.profs_per_activity[activity]
+            ]
+            for activity in constraints_manager.activities
+        ]
+        self.penalties = constraints_manager.penalty_table()
+        self.max_pauses = [
+            constraints_manager.professor_constraints[prof].max_pause
+            for prof in constraints_manager.profs
+        ]
+
+    def initial_solution(self):
+        """Returns a complete timetable built by one greedy hill climbing descent"""
+        hill_climbing = RandomRestartHillClimbing(
+            1, self.max_iterations, self.initial_state, log=self.log
+        )
+        hill_climbing.progress = self.progress
+        _, solution = hill_climbing.hill_climbing(self.initial_state.clone())
+        return solution
+
+    def load_state(self, node):
+        """Builds the compact state (cells, occupancy and running totals) of a node"""
+        constraints_manager = self.constraints_manager
+        slots_count = len(constraints_manager.slots)
+
+        # Cells are indexed slot * rooms + room and hold (prof ID, activity ID) or None
+        self.cells = [None] * (slots_count * self.rooms_count)
+        self.busy_profs = [set() for _ in range(slots_count)]
+        self.scheduled_activities = [set() for _ in range(slots_count)]
+        self.prof_slots = [[] for _ in constraints_manager.profs]
+        self.covered = [0] * len(constraints_manager.activities)
+
+        for day_name, intervals in node.days.items():
+            for interval_tuple, assignments in intervals.items():
+                slot = constraints_manager.slot_index[(day_name, interval_tuple)]
+                for room, assignment in assignments.items():
+                    if not assignment:
+                        continue
+                    cell = slot * self.rooms_count + constraints_manager.room_ids[room]
+                    self.place(
+                        cell,
+                        (
+                            constraints_manager.prof_ids[assignment[0]],
+                            constraints_manager.activity_ids[assignment[1]],
+                        ),
+                    )
+
+        self.prof_pauses = [
+            self.pause_violations(prof, slots)
+            for prof, slots in enumerate(self.prof_slots)
+        ]
+        self.remaining_students = sum(
+            max(0, needed - covered)
+            for needed, covered in zip(self.needed_students, self.covered)
+        )
+        self.soft_violations = sum(
+            self.penalties[cell_assignment[0]][cell // self.rooms_count]
+            for cell, cell_assignment in enumerate(self.cells)
+            if cell_assignment is not None
+        )
+        self.pause_violations_total = sum(self.prof_pauses)
+
+    def cost(self):
+        """Returns the evaluation of the current timetable"""
+        return self.initial_state.evaluate(
+            self.remaining_students, self.soft_violations, self.pause_violations_total
+        )
+
+    def pause_violations(self, prof, slots):
+        """Returns the pause violations of a professor teaching in the given sorted slot indexes"""
+        max_pause = self.max_pauses[prof]
+        if max_pause is None or not slots:
+            return 0
+        return count_pause_violations(
+            max_pause, [self.constraints_manager.slots[slot] for slot in slots]
+        )
+
+    def place(self, cell, assignment):
+        """Puts an assignment in an empty cell and updates the occupancy"""
+        prof, activity = assignment
+        slot = cell // self.rooms_count
+        self.cells[cell] = assignment
+        self.busy_profs[slot].add(prof)
+        self.scheduled_activities[slot].add(activity)
+        bisect.insort(self.prof_slots[prof], slot)
+        self.covered[activity] += self.capacities[cell % self.rooms_count]
 
-            for neighbor in neighbors:
-                expanded_nodes += 1
-                for closed_node in closed_set:
-                    if neighbor.__eq__(closed_node):
-                        break
+    def take(self, cell):
+        """Empties a cell and updates the occupancy"""
+        prof, activity = self.cells[cell]
+        slot = cell // self.rooms_count
+        self.cells[cell] = None
+        self.busy_profs[slot].discard(prof)
+        self.scheduled_activities[slot].discard(activity)
+        self.prof_slots[prof].remove(slot)
+        self.covered[activity] -= self.capacities[cell % self.rooms_count]
 
-                clone = neighbor.clone()
-                clone.apply_assignment_on_best_node()
-                heapq.heappush(open_set, (clone.total_cost(), clone))
+    def changed_totals(self, changes):
+        """Returns the (remaining students, soft violations, pause violations) after setting the cells of changes"""
+        soft_violations = self.soft_violations
+        covered_deltas = {}
+        removed_slots = {}
+        added_slots = {}
+
+        for cell, assignment in changes:
+            slot = cell // self.rooms_count
+            capacity = self.capacities[cell % self.rooms_count]
+
+            old_assignment = self.cells[cell]
+            if old_assignment is not None:
+                prof, activity = old_assignment
+                soft_violations -= self.penalties[prof][slot]
+                covered_deltas[activity] = covered_deltas.get(activity, 0) - capacity
+                removed_slots.setdefault(prof, []).append(slot)
+
+            if assignment is not None:
+                prof, activity = assignment
+                soft_violations += self.penalties[prof][slot]
+                covered_deltas[activity] = covered_deltas.get(activity, 0) + capacity
+                added_slots.setdefault(prof, []).append(slot)
+
+        remaining_students = self.remaining_students
+        for activity, delta in covered_deltas.items():
+            if delta:
+                needed, covered = self.needed_students[activity], self.covered[activity]
+                remaining_students += max(0, needed - covered - delta) - max(
+                    0, needed - covered
+                )
+
+        # Only the pauses of the professors whose slots changed are recounted
+        pause_violations = self.pause_violations_total
+        for prof in removed_slots.keys() | added_slots.keys():
+            if self.max_pauses[prof] is None:
+                continue
+            slots = list(self.prof_slots[prof])
+            for slot in removed_slots.get(prof, []):
+                slots.remove(slot)
+            slots = sorted(slots + added_slots.get(prof, []))
+            pause_violations += self.pause_violations(prof, slots) - self.prof_pauses[prof]
+
+        return remaining_students, soft_violations, pause_violations
+
+    def apply_changes(self, changes):
+        """Sets the cells of changes and updates the running totals"""
+        (
+            self.remaining_students,
+            self.soft_violations,
+            self.pause_violations_total,
+        ) = self.changed_totals(changes)
+
+        # Professors leaving or entering a cell have their pauses recounted
+        changed_profs = set()
+        for cell, _ in changes:
+            if self.cells[cell] is not None:
+                changed_profs.add(self.cells[cell][0])
+                self.take(cell)
+        for cell, assignment in changes:
+            if assignment is not None:
+                changed_profs.add(assignment[0])
+                self.place(cell, assignment)
+
+        for prof in changed_profs:
+            self.prof_pauses[prof] = self.pause_violations(prof, self.prof_slots[prof])
+
+    def random_move(self):
+        """Returns the changes of one random feasible move, None if none was found"""
+        cells_count = len(self.cells)
+        for _ in range(self.MAX_MOVE_TRIES):
+            cell = random.randrange(cells_count)
+
+            if self.cells[cell] is None:
+                changes = self.assign(cell) if self.remaining_students > 0 else None
+            else:
+                move_type = random.randrange(3)
+                other = random.randrange(cells_count)
+                if move_type == self.RELOCATE:
+                    changes = (
+                        self.relocate(cell, other) if self.cells[other] is None else None
+                    )
+                elif move_type == self.SWAP:
+                    changes = (
+                        self.swap(cell, other) if self.cells[other] is not None else None
+                    )
+                else:
+                    changes = self.change_prof(cell)
+
+            if changes is not None:
+                return changes
 
-        print("No solution found")
         return None
+
+    def relocate(self, cell, target):
+        """Returns the changes moving the assignment of a cell to an empty cell, None if it is not feasible"""
+        prof, activity = self.cells[cell]
+        slot, target_slot = cell // self.rooms_count, target // self.rooms_count
+
+        if activity not in self.room_activities[target % self.rooms_count]:
+            return None
+        if target_slot != slot and (
+            prof in self.busy_profs[target_slot]
+            or activity in self.scheduled_activities[target_slot]
+        ):
+            return None
+
+        return ((cell, None), (target, (prof, activity)))
+
+    def swap(self, cell, other):
+        """Returns the changes swapping the assignments of two cells, None if it is not feasible"""
+        assignment, other_assignment = self.cells[cell], self.cells[other]
+        if cell == other or assignment == other_assignment:
+            return None
+
+        (prof, activity), (other_prof, other_activity) = assignment, other_assignment
+        if activity not in self.room_activities[other % self.rooms_count]:
+            return None
+        if other_activity not in self.room_activities[cell % self.rooms_count]:
+            return None
+
+        slot, other_slot = cell // self.rooms_count, other // self.rooms_count
+        if slot != other_slot:
+            if prof != other_prof and (
+                prof in self.busy_profs[other_slot]
+                or other_prof in self.busy_profs[slot]
+            ):
+                return None
+            if activity != other_activity and (
+                activity in self.scheduled_activities[other_slot]
+                or other_activity in self.scheduled_activities[slot]
+            ):
+                return None
+
+        return ((cell, other_assignment), (other, assignment))
+
+    def change_prof(self, cell):
+        """Returns the changes giving the assignment of a cell to another professor, None if there is none available"""
+        prof, activity = self.cells[cell]
+        slot = cell // self.rooms_count
+
+        candidates = [
+            other_prof
+            for other_prof in self.activity_profs[activity]
+            if other_prof != prof
+            and other_prof not in self.busy_profs[slot]
+            and len(self.prof_slots[other_prof]) < ConstraintManager.MAX_PROF_SLOTS
+        ]
+        if not candidates:
+            return None
+
+        return ((cell, (random.choice(candidates), activity)),)
+
+    def assign(self, cell):
+        """Returns the changes assigning an activity that still has students to an empty cell, None if there is none"""
+        slot = cell // self.rooms_count
+        activities = [
+            activity
+            for activity in self.room_activities[cell % self.rooms_count]
+            if self.covered[activity] < self.needed_students[activity]
+            and activity not in self.scheduled_activities[slot]
+        ]
+        if not activities:
+            return None
+
+        activity = random.choice(activities)
+        candidates = [
+            prof
+            for prof in self.activity_profs[activity]
+            if prof not in self.busy_profs[slot]
+            and len(self.prof_slots[prof]) < ConstraintManager.MAX_PROF_SLOTS
+        ]
+        if not candidates:
+            return None
+
+        return ((cell, (random.choice(candidates), activity)),)
+
+    def build_node(self, cells):
+        """Returns the TimetableNode of the given cells"""
+        return build_node_from_cells(self.initial_state, cells)
+
+
+class TabuSearch(CompleteTimetableSearch):
+    """Tabu search over complete timetables.
+
+    Every iteration takes the best of a sample of moves. Putting back an assignment
+    that was removed in the last `tenure` iterations is tabu, unless it leads to the
+    best timetable found so far (aspiration).
+    """
+
+    def __init__(
+        self,
+        initial_state: TimetableNode,
+        max_iterations=20000,
+        tenure=20,
+        neighborhood_size=300,
+        max_stagnation=3000,
+        time_limit=None,
+        log=None,
+    ):
+        """Constructor for the TabuSearch class"""
+        super().__init__(initial_state, max_iterations, time_limit, log)
+        self.tenure = tenure
+        # Number of candidate moves scored every iteration
+        self.neighborhood_size = neighborhood_size
+        # Iterations without improving the best timetable before stopping
+        self.max_stagnation = max_stagnation
+
+    def search(self):
+        """Improves a complete timetable, returns the best node found"""
+        self.progress = SearchProgress(self.time_limit)
+        self.load_state(self.initial_solution())
+
+        best_cost = self.cost()
+        best_cells = list(self.cells)
+        self.progress.improve(best_cost, 0)
+        tabu = {}
+        stagnation = 0
+        iteration = 0
+
+        while iteration < self.max_iterations and best_cost > 0:
+            if stagnation >= self.max_stagnation or self.progress.expired():
+                break
+            iteration += 1
+            stagnation += 1
+
+            best_move = None
+            best_move_cost = float("inf")
+            for move, changes in self.sample_moves():
+                move_cost = self.initial_state.evaluate(*self.changed_totals(changes))
+                if move_cost >= best_move_cost:
+                    continue
+
+                # Tabu moves are only taken if they beat the best timetable (aspiration)
+                is_tabu = any(
+                    tabu.get((cell, assignment), 0) > iteration
+                    for cell, assignment in changes
+                    if assignment is not None
+                )
+                if is_tabu and move_cost >= best_cost:
+                    continue
+
+                best_move, best_move_cost = changes, move_cost
+
+            if best_move is None:
+                continue
+
+            # The assignments taken out of their cells can't come back for a while
+            for cell, _ in best_move:
+                if self.cells[cell] is not None:
+                    tabu[(cell, self.cells[cell])] = iteration + self.tenure
+            self.apply_changes(best_move)
+
+            if best_move_cost < best_cost:
+                best_cost = best_move_cost
+                best_cells = list(self.cells)
+                self.progress.improve(best_cost, iteration)
+                stagnation = 0
+
+            if self.log.due():
+                self.log.progress(
+                    "tabu",
+                    iteration=iteration,
+                    cost=best_move_cost,
+                    best=best_cost,
+                    remaining_students=self.remaining_students,
+                    elapsed=round(self.progress.elapsed(), 2),
+                )
+
+        self.total_iterations = iteration
+        self.progress.finish()
+        self.log.info(f"Tabu iterations: {iteration}")
+        result = self.build_node(best_cells)
+        self.log.info(
+            f"Number of students not assigned: {result.get_remaining_students()}"
+        )
+        return result
+
+    def sample_moves(self):
+        """Returns random feasible moves as (move type, cell changes) pairs.
+
+        Half of the moves start from a cell that violates a soft constraint, so the
+        search focuses on the assignments that can still be improved.
+        """
+        occupied = []
+        empty = []
+        conflicting = []
+        for cell, assignment in enumerate(self.cells):
+            if assignment is None:
+                empty.append(cell)
+                continue
+            occupied.append(cell)
+            prof = assignment[0]
+            if self.penalties[prof][cell // self.rooms_count] or self.prof_pauses[prof]:
+                conflicting.append(cell)
+
+        moves = []
+        if not occupied:
+            return moves
+
+        for _ in range(self.neighborhood_size):
+            if conflicting and random.random() < 0.5:
+                cell = random.choice(conflicting)
+            else:
+                cell = random.choice(occupied)
+
+            move_type = random.randrange(3)
+            if self.remaining_students > 0 and empty and random.random() < 0.25:
+                move_type = self.ASSIGN
+                changes = self.assign(random.choice(empty))
+            elif move_type == self.RELOCATE and empty:
+                changes = self.relocate(cell, random.choice(empty))
+            elif move_type == self.SWAP:
+                changes = self.swap(cell, random.choice(occupied))
+            else:
+                move_type = self.CHANGE_PROF
+                changes = self.change_prof(cell)
+
+            if changes is not None:
+                moves.append((move_type, changes))
+
+        return moves
+
+
+class SimulatedAnnealing(CompleteTimetableSearch):
+    """Simulated annealing over complete timetables.
+
+    Every step draws one random move and accepts it if it doesn't make the timetable
+    worse, or with probability exp(-delta / T) otherwise. With geometric cooling the
+    temperature is multiplied by cooling_rate every step. With adaptive cooling the
+    rate is tuned every window of steps, cooling faster when more than
+    target_acceptance of the worsening moves were accepted and slower when much
+    fewer were. After reheat_after steps without a new best timetable, or once the
+    temperature is negligible, it is raised back to reheat_ratio of the initial one.
+    """
+
+    COOLING_SCHEDULES = ["geometric", "adaptive"]
+
+    # Steps between two adjustments of the adaptive cooling
+    ADAPTIVE_WINDOW = 100
+    # Moves drawn to estimate the initial temperature
+    TEMPERATURE_SAMPLES = 200
+    # Probability of accepting an average worsening move at the initial temperature
+    INITIAL_ACCEPTANCE = 0.2
+    # The temperature is negligible below this fraction of the initial temperature
+    MIN_TEMPERATURE_RATIO = 1e-4
+
+    def __init__(
+        self,
+        initial_state: TimetableNode,
+        max_iterations=200000,
+        initial_temperature=None,
+        cooling="geometric",
+        cooling_rate=0.9995,
+        target_acceptance=0.2,
+        reheat_after=20000,
+        reheat_ratio=0.1,
+        time_limit=None,
+        log=None,
+    ):
+        """Constructor for the SimulatedAnnealing class, the initial temperature is estimated from the move deltas if not given"""
+        super().__init__(initial_state, max_iterations, time_limit, log)
+        if cooling not in self.COOLING_SCHEDULES:
+            raise ValueError(f"Unknown cooling schedule {cooling}")
+
+        self.initial_temperature = initial_temperature
+        self.cooling = cooling
+        self.cooling_rate = cooling_rate
+        self.target_acceptance = target_acceptance
+        self.reheat_after = reheat_after
+        self.reheat_ratio = reheat_ratio
+        self.reheats = 0
+
+    def estimate_initial_temperature(self, current_cost):
+        """Returns the temperature at which the median worsening move is accepted with INITIAL_ACCEPTANCE probability.
+
+        The median is used since the few moves that uncover students cost orders of
+        magnitude more than the others.
+        """
+        deltas = []
+        for _ in range(self.TEMPERATURE_SAMPLES):
+            changes = self.random_move()
+            if changes is None:
+                continue
+            delta = (
+                self.initial_state.evaluate(*self.changed_totals(changes))
+                - current_cost
+            )
+            if delta > 0:
+                deltas.append(delta)
+
+        if not deltas:
+            return 1.0
+        return -statistics.median(deltas) / math.log(self.INITIAL_ACCEPTANCE)
+
+    def search(self):
+        """Anneals a complete timetable, returns the best node found"""
+        self.progress = SearchProgress(self.time_limit)
+        self.load_state(self.initial_solution())
+
+        current_cost = self.cost()
+        best_cost = current_cost
+        best_cells = list(self.cells)
+        self.progress.improve(best_cost, 0)
+
+        initial_temperature = self.initial_temperature
+        if initial_temperature is None:
+            initial_temperature = self.estimate_initial_temperature(current_cost)
+        min_temperature = initial_temperature * self.MIN_TEMPERATURE_RATIO
+        temperature = initial_temperature
+        cooling_rate = self.cooling_rate
+
+        stagnation = 0
+        worsening_moves = 0
+        accepted_worsening_moves = 0
+        iteration = 0
+        self.reheats = 0
+
+        while iteration < self.max_iterations and best_cost > 0:
+            # Checking the clock is the most expensive part of a step, it is done every 100 steps
+            if iteration % 100 == 0 and self.progress.expired():
+                break
+            iteration += 1
+            stagnation += 1
+
+            changes = self.random_move()
+            if changes is not None:
+                move_cost = self.initial_state.evaluate(*self.changed_totals(changes))
+                delta = move_cost - current_cost
+
+                if delta <= 0:
+                    accepted = True
+                else:
+                    worsening_moves += 1
+                    accepted = random.random() < math.exp(-delta / temperature)
+                    accepted_worsening_moves += accepted
+
+                if accepted:
+                    self.apply_changes(changes)
+                    current_cost = move_cost
+
+                    if current_cost < best_cost:
+                        best_cost = current_cost
+                        best_cells = list(self.cells)
+                        self.progress.improve(best_cost, iteration)
+                        stagnation = 0
+
+            if self.cooling == "adaptive" and iteration % self.ADAPTIVE_WINDOW == 0:
+                acceptance = accepted_worsening_moves / max(1, worsening_moves)
+                if acceptance > self.target_acceptance:
+                    cooling_rate = self.cooling_rate**2
+                elif acceptance < self.target_acceptance / 2:
+                    cooling_rate = math.sqrt(self.cooling_rate)
+                else:
+                    cooling_rate = self.cooling_rate
+                worsening_moves = accepted_worsening_moves = 0
+            temperature *= cooling_rate
+
+            # Reheating starts again from the best timetable found so far
+            if stagnation >= self.reheat_after or temperature < min_temperature:
+                temperature = max(temperature, initial_temperature * self.reheat_ratio)
+                if current_cost > best_cost:
+                    self.load_state(self.build_node(best_cells))
+                    current_cost = best_cost
+                stagnation = 0
+                self.reheats += 1
+                self.log.debug("reheat", iteration=iteration, temperature=temperature)
+
+            if self.log.due():
+                self.log.progress(
+                    "sa",
+                    iteration=iteration,
+                    temperature=round(temperature, 2),
+                    cost=current_cost,
+                    best=best_cost,
+                    elapsed=round(self.progress.elapsed(), 2),
+                )
+
+        self.total_iterations = iteration
+        self.progress.finish()
+        self.log.info(f"Annealing steps: {iteration} ({self.reheats} reheats)")
+        result = self.build_node(best_cells)
+        self.log.info(
+            f"Number of students not assigned: {result.get_remaining_students()}"
+        )
+        return result
+
+
+class BacktrackingSearch:
+    """Exact backtracking search over the cells of the timetable.
+
+    The variables are the cells, indexed slot * rooms + room, and the values of a
+    cell are the (prof ID, activity ID) pairs the room and the professor allow, or
+    None, always tried last, to leave it empty. Only the hard constraints checked by
+    check_constraints are enforced: a professor teaches once per slot and at most
+    ConstraintManager.MAX_PROF_SLOTS times, and every activity gets enough seats.
+    Every assignment is followed by forward checking, which removes the values it
+    rules out and fails as soon as the open cells can no longer seat the students
+    of an activity, or the professors can no longer teach enough classes to seat
+    everyone. The next cell is the open cell of the largest room, with the fewest values left
+    on ties, and the failures backjump to the deepest decisions that caused them
+    (conflict-directed backjumping).
+
+    A first pass only uses the values without soft constraint penalties, within a
+    node budget, the second pass uses all the values and is complete: if it fails,
+    no timetable can seat all the students.
+    """
+
+    # Nodes of the pass without penalized values, before falling back to all the values
+    STRICT_NODE_LIMIT = 5000
+
+    # Result of a node that pushed its frame on the search stack
+    BRANCHED = "branched"
+
+    def __init__(self, initial_state: TimetableNode, time_limit=None, log=None):
+        """Constructor for the BacktrackingSearch class"""
+        self.initial_state = initial_state
+        self.time_limit = time_limit
+        self.progress = SearchProgress(time_limit)
+        self.metrics = initial_state.metrics
+        self.log = log if log is not None else SearchLog()
+        self.total_iterations = 0
+
+        constraints_manager = initial_state.constraints_manager
+        self.constraints_manager = constraints_manager
+        self.rooms_count = len(constraints_manager.rooms)
+        self.cells_count = len(constraints_manager.slots) * self.rooms_count
+        self.capacities = [
+            constraints_manager.room_capacities[
+                constraints_manager.rooms[cell % self.rooms_count]
+            ]
+            for cell in range(self.cells_count)
+        ]
+        self.needed_students = [
+            constraints_manager.constraints[MATERII][activity]
+            for activity in constraints_manager.activities
+        ]
+        self.penalties = constraints_manager.penalty_table()
+        # Distinct room capacities, largest first, and the index of the capacity of every cell:
+        # the class bounds count the open cells per capacity instead of sorting them
+        self.capacity_values = sorted(set(self.capacities), reverse=True)
+        self.capacity_ranks = [
+            self.capacity_values.index(capacity) for capacity in self.capacities
+        ]
+        # Cells of every capacity, for the class bound with every room open
+        self.all_rooms = [
+            self.capacity_ranks.count(rank) for rank in range(len(self.capacity_values))
+        ]
+        # Largest room, the first one filled in every slot
+        self.lead_room = max(
+            range(self.rooms_count), key=lambda room: (self.capacities[room], -room)
+        )
+
+        # Professors teaching every activity
+        self.activity_profs = [
+            [
+                constraints_manager.prof_ids[prof]
+                for prof in constraints_manager.profs_per_activity[activity]
+            ]
+            for activity in constraints_manager.activities
+        ]
+
+        # Values every cell allows, before any assignment
+        self.cell_values = []
+        for cell in range(self.cells_count):
+            room = constraints_manager.rooms[cell % self.rooms_count]
+            self.cell_values.append(
+                [
+                    (
+                        constraints_manager.prof_ids[prof],
+                        constraints_manager.activity_ids[activity],
+                    )
+                    for activity in constraints_manager.activities_per_room[room]
+                    for prof in constraints_manager.profs_per_activity[activity]
+                ]
+            )
+
+    def search(self):
+        """Returns a timetable seating all the students, or the best partial one if there is none"""
+        self.progress = SearchProgress(self.time_limit)
+        self.nodes = 0
+        self.backjumps = 0
+        self.best_remaining = float("inf")
+        self.best_cells = [None] * self.cells_count
+
+        solved = self.solve(strict=True, node_limit=self.STRICT_NODE_LIMIT)
+        if not solved and not self.progress.timed_out:
+            self.log.debug("strict_pass_failed", nodes=self.nodes)
+            solved = self.solve(strict=False)
+
+        self.total_iterations = self.nodes
+        self.progress.finish()
+        self.log.info(f"Backtracking nodes: {self.nodes} ({self.backjumps} backjumps)")
+        if solved:
+            self.log.info("Solution found!")
+        elif self.progress.timed_out:
+            self.log.info("Time limit reached, returning the best partial timetable")
+        else:
+            self.log.info("No timetable can seat all the students")
+
+        result = build_node_from_cells(self.initial_state, self.best_cells)
+        self.log.info(
+            f"Number of students not assigned: {result.get_remaining_students()}"
+        )
+        return result
+
+    def solve(self, strict, node_limit=None):
+        """Runs one backtracking pass, returns True if every student got a seat"""
+        self.strict = strict
+        self.node_limit = node_limit
+        self.stopped = False
+        self.cells = [None] * self.cells_count
+        # Level of the decision that closed every cell
+        self.cell_levels = [None] * self.cells_count
+        self.open_cells = set(range(self.cells_count))
+        self.domains = [
+            {value for value in values if self.in_pass(cell, value)}
+            for cell, values in enumerate(self.cell_values)
+        ]
+        # (cell, value) pairs of the pass of every professor and of every activity, for the conflict sets
+        self.prof_values = [[] for _ in self.constraints_manager.profs]
+        self.activity_values = [[] for _ in self.constraints_manager.activities]
+        for cell, domain in enumerate(self.domains):
+            for value in domain:
+                self.prof_values[value[0]].append((cell, value))
+                self.activity_values[value[1]].append((cell, value))
+        # Cell where every professor teaches in every slot
+        self.prof_cells = [{} for _ in self.constraints_manager.slots]
+        self.prof_levels = [[] for _ in self.constraints_manager.profs]
+        self.activity_levels = [[] for _ in self.constraints_manager.activities]
+        self.covered = [0] * len(self.constraints_manager.activities)
+
+        # Seats an activity can still get: its covered seats and the open cells offering it
+        self.offers = [
+            [0] * len(self.constraints_manager.activities)
+            for _ in range(self.cells_count)
+        ]
+        self.potential = [0] * len(self.constraints_manager.activities)
+        # Open cells of every capacity with values left, and offering every activity
+        self.open_rooms = [0] * len(self.capacity_values)
+        self.open_offers = [
+            [0] * len(self.capacity_values) for _ in self.constraints_manager.activities
+        ]
+        for cell, domain in enumerate(self.domains):
+            rank = self.capacity_ranks[cell]
+            if domain:
+                self.open_rooms[rank] += 1
+            for _, activity in domain:
+                self.offers[cell][activity] += 1
+                if self.offers[cell][activity] == 1:
+                    self.potential[activity] += self.capacities[cell]
+                    self.open_offers[activity][rank] += 1
+
+        # Values of every professor in the open cells of every slot, and the number of
+        # slots where a professor still has values, kept up to date for the class bound
+        slots_count = len(self.constraints_manager.slots)
+        self.prof_slot_values = [
+            [0] * slots_count for _ in self.constraints_manager.profs
+        ]
+        self.prof_open_slots = [0] * len(self.constraints_manager.profs)
+        for cell, domain in enumerate(self.domains):
+            for prof, _ in domain:
+                self.count_prof_value(prof, cell // self.rooms_count, 1)
+
+        # Removed values as (cell, value, levels of the decisions that removed it)
+        self.trail = []
+        # Levels of the decisions that removed every value on the trail
+        self.removal_levels = {}
+
+        if any(
+            potential < needed
+            for potential, needed in zip(self.potential, self.needed_students)
+        ):
+            return False
+        return self.backtrack() is None
+
+    def in_pass(self, cell, value):
+        """Returns True if a value is tried in this pass: its activity has students to seat and,
+        in the first pass, its professor has no penalty in the slot"""
+        prof, activity = value
+        if not self.needed_students[activity]:
+            return False
+        return not self.strict or self.penalties[prof][cell // self.rooms_count] == 0
+
+    def backtrack(self):
+        """Runs the search, returns None when solved or the conflict set of the failure.
+
+        The search is a loop over an explicit stack, so its depth isn't bounded by the
+        recursion limit. The frame of level L (stack[L - 1]) is [cell, values left to
+        try, trail mark of the value being tried, conflict set of the tried values].
+        """
+        stack = []
+        # Result of the last node: None when solved, BRANCHED when it pushed a frame,
+        # otherwise the conflict set of its failure, handled by the frame on top
+        result = self.open_node(stack)
+
+        while True:
+            if result is None:
+                return None
+
+            if result is not self.BRANCHED:
+                if not stack:
+                    return result
+                level = len(stack)
+                cell, _, mark, conflict = stack[-1]
+                self.undo(cell, mark)
+
+                # The failure doesn't depend on this cell, its other values would fail as well
+                if level not in result:
+                    if not self.stopped:
+                        self.backjumps += 1
+                    stack.pop()
+                    continue
+                conflict |= result
+                conflict.discard(level)
+
+            frame = stack[-1]
+            cell, values, _, conflict = frame
+            if not values:
+                stack.pop()
+                result = conflict
+                continue
+
+            frame[2] = len(self.trail)
+            result = self.assign(cell, values.pop(), len(stack))
+            if result is None:
+                result = self.open_node(stack)
+
+    def open_node(self, stack):
+        """Visits the node reached after the decisions of the stack, pushes its frame unless it is solved or stopped"""
+        self.nodes += 1
+        remaining_students = sum(
+            max(0, needed - covered)
+            for needed, covered in zip(self.needed_students, self.covered)
+        )
+        if remaining_students < self.best_remaining:
+            self.best_remaining = remaining_students
+            self.best_cells = list(self.cells)
+            self.progress.improve(remaining_students, self.nodes)
+        if remaining_students == 0:
+            return None
+
+        if self.log.due():
+            self.log.progress(
+                "backtracking",
+                nodes=self.nodes,
+                level=len(stack) + 1,
+                backjumps=self.backjumps,
+                remaining_students=remaining_students,
+                best=self.best_remaining,
+                elapsed=round(self.progress.elapsed(), 2),
+            )
+
+        # An empty conflict set unwinds the whole search
+        if (self.node_limit is not None and self.nodes > self.node_limit) or (
+            self.progress.expired()
+        ):
+            self.stopped = True
+        if self.stopped:
+            return set()
+
+        cell = self.select_cell()
+        # Values are popped from the end, the first one to try is last
+        stack.append([cell, self.order_values(cell)[::-1], None, set()])
+        return self.BRANCHED
+
+    def select_cell(self):
+        """Returns the open cell with the largest room, the fewest values left on ties"""
+        return min(
+            self.open_cells,
+            key=lambda cell: (
+                not self.domains[cell],
+                -self.capacities[cell],
+                len(self.domains[cell]),
+                cell,
+            ),
+        )
+
+    def order_values(self, cell):
+        """Returns the values of a cell to try: without penalties, for the most needed activities and the least busy professors first"""
+        slot = cell // self.rooms_count
+        values = sorted(
+            self.domains[cell],
+            key=lambda value: (
+                self.penalties[value[0]][slot],
+                self.potential[value[1]] - self.needed_students[value[1]],
+                len(self.prof_levels[value[0]]),
+            ),
+        )
+        values.append(None)
+        return values
+
+    def remove(self, cell, value, levels, touched):
+        """Removes a value from the domain of a cell, recording it on the trail"""
+        self.domains[cell].discard(value)
+        self.trail.append((cell, value, levels))
+        self.removal_levels[cell, value] = levels
+
+        prof, activity = value
+        rank = self.capacity_ranks[cell]
+        if not self.domains[cell]:
+            self.open_rooms[rank] -= 1
+        self.count_prof_value(prof, cell // self.rooms_count, -1)
+        self.offers[cell][activity] -= 1
+        if self.offers[cell][activity] == 0:
+            self.potential[activity] -= self.capacities[cell]
+            self.open_offers[activity][rank] -= 1
+            touched.add(activity)
+
+    def count_prof_value(self, prof, slot, delta):
+        """Adds delta to the values of a professor in the open cells of a slot"""
+        values = self.prof_slot_values[prof]
+        values[slot] += delta
+        if delta > 0 and values[slot] == delta:
+            self.prof_open_slots[prof] += 1
+        elif delta < 0 and values[slot] == 0:
+            self.prof_open_slots[prof] -= 1
+
+    def assign(self, cell, value, level):
+        """Assigns a value to a cell and propagates it, returns None or the conflict set of the failure"""
+        decision = frozenset((level,))
+        touched = set()
+
+        # The cell is closed, its other values are gone
+        for other in list(self.domains[cell]):
+            if other != value:
+                self.remove(cell, other, decision, touched)
+        self.open_cells.discard(cell)
+        self.cells[cell] = value
+        self.cell_levels[cell] = level
+
+        # The complete pass treats all the slots alike, so only the timetables using the largest
+        # room in a prefix of the slots are searched: leaving it empty leaves it empty afterwards
+        if value is None and not self.strict and cell % self.rooms_count == self.lead_room:
+            for later_cell in range(
+                cell + self.rooms_count, self.cells_count, self.rooms_count
+            ):
+                if later_cell in self.open_cells:
+                    for other in list(self.domains[later_cell]):
+                        self.remove(later_cell, other, decision, touched)
+
+        if value is not None:
+            prof, activity = value
+            capacity = self.capacities[cell]
+            # The seats of the cell move from the potential of the activity to its covered seats
+            self.covered[activity] += capacity
+            self.open_rooms[self.capacity_ranks[cell]] -= 1
+            self.open_offers[activity][self.capacity_ranks[cell]] -= 1
+            # and the professor's value leaves the open cells
+            self.count_prof_value(prof, cell // self.rooms_count, -1)
+            self.prof_cells[cell // self.rooms_count][prof] = cell
+            self.prof_levels[prof].append(level)
+            self.activity_levels[activity].append(level)
+
+            # The professor can't teach in the other rooms of the slot
+            slot_start = cell - cell % self.rooms_count
+            for other_cell in range(slot_start, slot_start + self.rooms_count):
+                if other_cell in self.open_cells:
+                    for other in list(self.domains[other_cell]):
+                        if other[0] == prof:
+                            self.remove(other_cell, other, decision, touched)
+
+            # A professor with all the slots taken can't teach anymore
+            if len(self.prof_levels[prof]) == ConstraintManager.MAX_PROF_SLOTS:
+                levels = frozenset(self.prof_levels[prof])
+                for other_cell in self.open_cells:
+                    for other in list(self.domains[other_cell]):
+                        if other[0] == prof:
+                            self.remove(other_cell, other, levels, touched)
+
+            # A seated activity doesn't need more rooms
+            if (
+                self.covered[activity] - capacity
+                < self.needed_students[activity]
+                <= self.covered[activity]
+            ):
+                levels = frozenset(self.activity_levels[activity])
+                for other_cell in self.open_cells:
+                    for other in list(self.domains[other_cell]):
+                        if other[1] == activity:
+                            self.remove(other_cell, other, levels, touched)
+
+        # The open cells must still be able to seat the students of every activity
+        for activity in touched:
+            if self.potential[activity] < self.needed_students[activity]:
+                return self.explain(activity)
+
+        return self.class_bound_conflict(level)
+
+    def class_bound_conflict(self, level):
+        """Returns None if the professors can still teach the classes needed to seat the
+        remaining students, otherwise the conflict set of the failure"""
+        remaining_students = [
+            max(0, needed - covered)
+            for needed, covered in zip(self.needed_students, self.covered)
+        ]
+        # A professor teaches once per slot, in the open slots still offering them, up to the slot limit
+        available_classes = [
+            min(ConstraintManager.MAX_PROF_SLOTS - len(levels), open_slots)
+            for levels, open_slots in zip(self.prof_levels, self.prof_open_slots)
+        ]
+
+        # Every class seats a single activity, in the open rooms still offering it, and is
+        # taught by one of its professors
+        activity_bounds = []
+        for activity, students in enumerate(remaining_students):
+            classes = self.classes_needed(students, self.open_offers[activity])
+            if classes is None:
+                return self.explain(activity)
+            activity_bounds.append((activity, classes))
+
+            profs = self.activity_profs[activity]
+            if classes > sum(available_classes[prof] for prof in profs):
+                return self.class_conflict(profs, [activity_bounds[-1]])
+
+        # Fewest classes seating all the remaining students, taking the largest open rooms first
+        needed_classes = self.classes_needed(sum(remaining_students), self.open_rooms)
+        if needed_classes is None:
+            # The open cells can't seat the remaining students, every decision closed some
+            return set(range(1, level + 1))
+
+        # The same holds for all the activities with students left and all their professors
+        activity_bounds = [bound for bound in activity_bounds if bound[1]]
+        profs = sorted(
+            {
+                prof
+                for activity, _ in activity_bounds
+                for prof in self.activity_profs[activity]
+            }
+        )
+        available = sum(available_classes[prof] for prof in profs)
+        activity_classes = sum(classes for _, classes in activity_bounds)
+        if available >= max(needed_classes, activity_classes):
+            return None
+        if available < activity_classes:
+            return self.class_conflict(profs, activity_bounds)
+        if available >= self.classes_needed(sum(remaining_students), self.all_rooms):
+            # The closed cells matter as well
+            return set(range(1, level + 1))
+        return self.class_conflict(profs, [])
+
+    def class_conflict(self, profs, activity_bounds):
+        """Returns the levels of the decisions a class bound failure depends on: the classes of
+        the professors, the slots they can no longer teach in when these bound their classes, and
+        the cells the activities lost that are larger than the ones they need"""
+        conflict = set()
+        for prof in profs:
+            conflict.update(self.prof_levels[prof])
+            if self.prof_open_slots[prof] >= ConstraintManager.MAX_PROF_SLOTS - len(
+                self.prof_levels[prof]
+            ):
+                continue
+            slot_values = self.prof_slot_values[prof]
+            for cell, value in self.prof_values[prof]:
+                if not slot_values[cell // self.rooms_count]:
+                    conflict |= self.removal_reason(cell, value)
+
+        for activity, classes in activity_bounds:
+            if classes > 1:
+                conflict |= self.explain(
+                    activity, self.class_capacity(self.open_offers[activity], classes - 2)
+                )
+        return conflict
+
+    def classes_needed(self, remaining_students, room_counts):
+        """Returns the fewest classes seating the remaining students, taking the largest rooms first,
+        given the number of rooms of every capacity, or None if they can't"""
+        needed_classes = 0
+        for capacity, count in zip(self.capacity_values, room_counts):
+            if remaining_students <= 0:
+                break
+            classes = min(count, -(-remaining_students // capacity))
+            needed_classes += classes
+            remaining_students -= classes * capacity
+        return needed_classes if remaining_students <= 0 else None
+
+    def class_capacity(self, room_counts, index):
+        """Returns the capacity of the room of a class, classes taking the largest rooms first"""
+        for capacity, count in zip(self.capacity_values, room_counts):
+            if index < count:
+                return capacity
+            index -= count
+        return 0
+
+    def explain(self, activity, larger_than=0):
+        """Returns the levels of the decisions that took the cells offering an activity away, only
+        counting the cells with more seats than larger_than"""
+        conflict = set()
+        for cell, value in self.activity_values[activity]:
+            if self.capacities[cell] > larger_than and not self.offers[cell][activity]:
+                conflict |= self.removal_reason(cell, value)
+        return conflict
+
+    def removal_reason(self, cell, value):
+        """Returns the levels of decisions ruling out a removed value, the professor's classes
+        first since they rule out the professor everywhere, then the slot and the cell"""
+        prof = value[0]
+        if len(self.prof_levels[prof]) >= ConstraintManager.MAX_PROF_SLOTS:
+            return set(self.prof_levels[prof])
+
+        # The professor already teaches in another room of the slot
+        other_cell = self.prof_cells[cell // self.rooms_count].get(prof, cell)
+        if other_cell != cell:
+            return {self.cell_levels[other_cell]}
+
+        if self.cell_levels[cell] is not None:
+            return {self.cell_levels[cell]}
+        return set(self.removal_levels.get((cell, value), ()))
+
+    def undo(self, cell, mark):
+        """Unassigns a cell and restores the values removed since the trail mark"""
+        value = self.cells[cell]
+        self.cells[cell] = None
+        self.cell_levels[cell] = None
+        self.open_cells.add(cell)
+        if value is not None:
+            prof, activity = value
+            self.covered[activity] -= self.capacities[cell]
+            self.open_rooms[self.capacity_ranks[cell]] += 1
+            self.open_offers[activity][self.capacity_ranks[cell]] += 1
+            self.count_prof_value(prof, cell // self.rooms_count, 1)
+            del self.prof_cells[cell // self.rooms_count][prof]
+            self.prof_levels[prof].pop()
+            self.activity_levels[activity].pop()
+
+        while len(self.trail) > mark:
+            removed_cell, removed_value, _ = self.trail.pop()
+            del self.removal_levels[removed_cell, removed_value]
+            if not self.domains[removed_cell]:
+                self.open_rooms[self.capacity_ranks[removed_cell]] += 1
+            self.domains[removed_cell].add(removed_value)
+            prof, activity = removed_value
+            self.count_prof_value(prof, removed_cell // self.rooms_count, 1)
+            self.offers[removed_cell][activity] += 1
+            if self.offers[removed_cell][activity] == 1:
+                self.potential[activity] += self.capacities[removed_cell]
+                self.open_offers[activity][self.capacity_ranks[removed_cell]] += 1
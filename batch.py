@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import glob
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from check_constraints import validate_timetable
+from instance_cache import load_instance
+from orar import (
+    ALGORITHM_NAMES,
+    OUTPUT_WRITERS,
+    create_initial_node,
+    solve,
+    write_result_to_file,
+)
+
+
+def expand_inputs(patterns):
+    """Returns the input files matching a list of paths and globs, without duplicates"""
+    input_paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for input_path in matches:
+            if input_path not in input_paths:
+                input_paths.append(input_path)
+    return input_paths
+
+
+def input_size(input_path):
+    """Returns the size of an input file, used to start the largest instances first"""
+    try:
+        return os.path.getsize(input_path)
+    except OSError:
+        return 0
+
+
+def solve_instance(
+    input_path,
+    algorithm,
+    output_dir,
+    formats=("txt",),
+    time_limit=None,
+    seed=None,
+    array_state=False,
+):
+    """Solves one input file in a worker process, writes its outputs and returns its summary row"""
+    filename = os.path.splitext(os.path.basename(input_path))[0]
+    row = {"input": filename, "algorithm": algorithm}
+    start_time = time.perf_counter()
+
+    try:
+        constraints_manager = load_instance(input_path)
+        initial_node = create_initial_node(
+            constraints_manager.constraints, array_state, constraints_manager
+        )
+
+        if seed is not None:
+            random.seed(seed)
+        # The output of the solvers of many instances would be interleaved, only the table is printed
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result, _ = solve(algorithm, initial_node, time_limit=time_limit)
+
+        if result is None:
+            row["error"] = "No solution found"
+        else:
+            write_result_to_file(
+                result, os.path.dirname(input_path), output_dir, filename, formats
+            )
+            report = validate_timetable(result.days, constraints_manager)
+            row["remaining_students"] = result.get_remaining_students()
+            row["mandatory_violations"] = report.mandatory_violations()
+            row["optional_violations"] = report.optional_violations()
+    except Exception as error:
+        row["error"] = f"{type(error).__name__}: {error}"
+
+    row["time"] = time.perf_counter() - start_time
+    return row
+
+
+def print_summary(rows, wall_time):
+    """Prints the time and quality of every instance"""
+    header = f"{'Input':<28}{'Algorithm':<10}{'Time (s)':>10}{'Remaining':>11}{'Mandatory':>11}{'Optional':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for row in sorted(rows, key=lambda row: row["input"]):
+        if "error" in row:
+            print(
+                f"{row['input']:<28}{row['algorithm']:<10}{row['time']:>10.2f}  {row['error']}"
+            )
+            continue
+
+        print(
+            f"{row['input']:<28}{row['algorithm']:<10}{row['time']:>10.2f}"
+            f"{row['remaining_students']:>11}{row['mandatory_violations']:>11}"
+            f"{row['optional_violations']:>10}"
+        )
+
+    solved_time = sum(row["time"] for row in rows)
+    print("-" * len(header))
+    print(
+        f"{len(rows)} instances in {wall_time:.2f}s wall time "
+        f"({solved_time:.2f}s of solving, {solved_time / wall_time if wall_time else 0:.2f}x)"
+    )
+
+
+def run_batch(
+    input_paths,
+    algorithm,
+    output_dir,
+    formats=("txt",),
+    workers=None,
+    time_limit=None,
+    seed=None,
+    array_state=False,
+):
+    """Solves the input files on a process pool and returns their summary rows"""
+    os.makedirs(output_dir, exist_ok=True)
+    rows = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                solve_instance,
+                input_path,
+                algorithm,
+                output_dir,
+                formats,
+                time_limit,
+                seed,
+                array_state,
+            )
+            # Largest inputs first, so a long instance doesn't start last and delay the batch
+            for input_path in sorted(input_paths, key=input_size, reverse=True)
+        ]
+
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            print(
+                f"[{len(rows)}/{len(futures)}] {row['input']} done in {row['time']:.2f}s",
+                file=sys.stderr,
+            )
+
+    return rows
+
+
+def main():
+    """Solves many input files concurrently"""
+    parser = argparse.ArgumentParser(
+        description="Solves many timetable inputs on a process pool"
+    )
+    parser.add_argument("algorithm", help=" or ".join(ALGORITHM_NAMES))
+    parser.add_argument("inputs", nargs="+", help="input files or globs")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of instances solved at the same time",
+    )
+    parser.add_argument("--output-dir", default="outputs/")
+    parser.add_argument(
+        "--output-format",
+        nargs="+",
+        choices=list(OUTPUT_WRITERS),
+        default=["txt"],
+    )
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        default=None,
+        help="time budget of every instance in seconds",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--array-state", action="store_true")
+    args = parser.parse_args()
+
+    if args.algorithm not in ALGORITHM_NAMES:
+        print("Algorithm not implemented")
+        sys.exit(2)
+
+    input_paths = expand_inputs(args.inputs)
+    start_time = time.perf_counter()
+    rows = run_batch(
+        input_paths,
+        args.algorithm,
+        os.path.join(args.output_dir, ""),
+        args.output_format,
+        args.workers,
+        args.time_limit,
+        args.seed,
+        args.array_state,
+    )
+    print_summary(rows, time.perf_counter() - start_time)
+
+    if any("error" in row for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from check_constraints import validate_timetable
+from orar import create_initial_node, solve
+from instance_cache import load_instance
+
+DEFAULT_SEEDS = [42, 69, 420]
+DEFAULT_THRESHOLD = 0.2
+# Seconds per run, unbounded A* doesn't finish on the larger inputs
+DEFAULT_TIME_LIMIT = 30.0
+
+# Searches over partial timetables, whose iterations expand nodes. The local searches
+# iterate over moves, they have no node count
+NODE_SEARCHES = {"astar", "beam", "bt"}
+
+# Metrics compared against the baseline, all of them are better when lower
+COMPARED_METRICS = [
+    "wall_time",
+    "remaining_students",
+    "mandatory_violations",
+    "optional_violations",
+]
+
+
+def run_solver(algorithm, initial_node, time_limit=None):
+    """Runs a solver on a fresh copy of the initial node, returns the result, its iterations and the number
+    of nodes it built (None for the local searches)"""
+    result, engine = solve(algorithm, initial_node, time_limit=time_limit)
+
+    if algorithm == "astar":
+        return result, engine.explored_nodes, engine.expanded_nodes
+    if algorithm in NODE_SEARCHES:
+        return result, engine.total_iterations, engine.total_iterations
+    return result, engine.total_iterations, None
+
+
+def benchmark_instance(input_path, algorithm, seed, time_limit=None):
+    """Runs one solver once on an input file and returns the measured metrics"""
+    # Instances are parsed once, the runs after the first one reuse the cached model
+    constraints_manager = load_instance(input_path)
+    yaml_dict = constraints_manager.constraints
+    initial_node = create_initial_node(yaml_dict, constraints_manager=constraints_manager)
+
+    # Solvers print their progress, it is not part of the measurement
+    random.seed(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        result, iterations, nodes = run_solver(algorithm, initial_node, time_limit)
+        wall_time = time.perf_counter() - start_time
+
+    if result is not None:
+        report = validate_timetable(result.days, constraints_manager)
+        mandatory_violations = report.mandatory_violations()
+        optional_violations = report.optional_violations()
+
+    return {
+        "input": os.path.splitext(os.path.basename(input_path))[0],
+        "algorithm": algorithm,
+        "seed": seed,
+        "wall_time": wall_time,
+        "iterations": iterations,
+        "nodes": nodes,
+        "iterations_per_second": iterations / wall_time if wall_time > 0 else 0.0,
+        "nodes_per_second": (
+            None if nodes is None else nodes / wall_time if wall_time > 0 else 0.0
+        ),
+        "solved": result is not None,
+        "remaining_students": result.get_remaining_students() if result else None,
+        "mandatory_violations": mandatory_violations if result else None,
+        "optional_violations": optional_violations if result else None,
+    }
+
+
+def summarize(runs):
+    """Returns the mean of every metric per (input, algorithm)"""
+    grouped = {}
+    for run in runs:
+        grouped.setdefault(run["input"], {}).setdefault(run["algorithm"], []).append(
+            run
+        )
+
+    summary = {}
+    for input_name, algorithms in grouped.items():
+        summary[input_name] = {}
+        for algorithm, algorithm_runs in algorithms.items():
+            metrics = {"runs": len(algorithm_runs)}
+            for metric in COMPARED_METRICS + [
+                "iterations",
+                "iterations_per_second",
+                "nodes_per_second",
+            ]:
+                values = [
+                    run[metric] for run in algorithm_runs if run[metric] is not None
+                ]
+                metrics[metric] = statistics.mean(values) if values else None
+            summary[input_name][algorithm] = metrics
+
+    return summary
+
+
+def compare_with_baseline(summary, baseline_summary, threshold=DEFAULT_THRESHOLD):
+    """Returns the list of metrics that got worse than the baseline by more than the threshold"""
+    regressions = []
+    for input_name, algorithms in summary.items():
+        for algorithm, metrics in algorithms.items():
+            baseline = baseline_summary.get(input_name, {}).get(algorithm)
+            if not baseline:
+                continue
+
+            for metric in COMPARED_METRICS:
+                current, previous = metrics.get(metric), baseline.get(metric)
+                if current is None or previous is None:
+                    continue
+
+                # Counts that were 0 regress as soon as they are not 0 anymore
+                limit = previous * (1 + threshold) if previous > 0 else 0
+                if current > limit:
+                    regressions.append(
+                        {
+                            "input": input_name,
+                            "algorithm": algorithm,
+                            "metric": metric,
+                            "baseline": previous,
+                            "current": current,
+                        }
+                    )
+
+    return regressions
+
+
+def run_benchmarks(input_paths, algorithms, seeds, repetitions, time_limit=None):
+    """Runs every algorithm on every input for every seed and repetition"""
+    runs = []
+    for input_path in input_paths:
+        for algorithm in algorithms:
+            for seed in seeds:
+                for repetition in range(repetitions):
+                    print(
+                        f"Running {algorithm} on {input_path} (seed {seed}, run {repetition + 1})..."
+                    )
+                    run = benchmark_instance(input_path, algorithm, seed, time_limit)
+                    run["repetition"] = repetition
+                    runs.append(run)
+
+    return runs
+
+
+def main():
+    """Runs the benchmark suite and compares it with a baseline"""
+    parser = argparse.ArgumentParser(
+        description="In-process benchmarks of the timetable solvers"
+    )
+    parser.add_argument(
+        "--inputs", default="inputs/*.yaml", help="glob of the input files"
+    )
+    parser.add_argument("--algorithms", nargs="+", default=["hc", "astar"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=DEFAULT_SEEDS)
+    parser.add_argument("--repetitions", type=int, default=1)
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        default=DEFAULT_TIME_LIMIT,
+        help="seconds per run, 0 for no limit",
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument(
+        "--baseline", default=None, help="results file to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative increase over the baseline reported as a regression",
+    )
+    args = parser.parse_args()
+
+    input_paths = sorted(glob.glob(args.inputs))
+    time_limit = args.time_limit or None
+    runs = run_benchmarks(
+        input_paths, args.algorithms, args.seeds, args.repetitions, time_limit
+    )
+    summary = summarize(runs)
+
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seeds": args.seeds,
+        "repetitions": args.repetitions,
+        "time_limit": time_limit,
+        "runs": runs,
+        "summary": summary,
+    }
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    for input_name, algorithms in summary.items():
+        for algorithm, metrics in algorithms.items():
+            print(
+                f"{input_name:<25} {algorithm:<6} {metrics['wall_time']:8.2f}s "
+                f"remaining={metrics['remaining_students']} "
+                f"optional={metrics['optional_violations']}"
+            )
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline_summary = json.load(file)["summary"]
+
+        regressions = compare_with_baseline(summary, baseline_summary, args.threshold)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['input']} {regression['algorithm']} {regression['metric']}: "
+                f"{regression['baseline']} -> {regression['current']}"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
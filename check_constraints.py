@@ -1,7 +1,15 @@
 import yaml
 import argparse
 import sys
+from collections import namedtuple
 from utils import read_yaml_file, get_profs_initials, pretty_print_timetable
+from structs import ConstraintManager, ProfessorConstraints, parse_interval_string
+from timetable_grid import TimetableGrid
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 ##################### MACROURI #####################
@@ -13,6 +21,8 @@ SALI = "Sali"
 CAPACITATE = "Capacitate"
 CONSTRANGERI = "Constrangeri"
 
+MAX_SLOTURI_PROFESOR = ConstraintManager.MAX_PROF_SLOTS
+
 #################### FUNCTII AUXILIARE ####################
 def parse_interval(interval: str):
     """
@@ -118,7 +128,7 @@ def check_mandatory_constraints(
 
     for day in timetable:
         for interval in timetable[day]:
-            profs_in_crt_interval = []
+            profs_in_crt_interval = set()
             for room in timetable[day][interval]:
                 if timetable[day][interval][room]:
                     prof, subject = timetable[day][interval][room]
@@ -129,7 +139,7 @@ def check_mandatory_constraints(
                         print(f"Profesorul {prof} preda 2 materii in acelasi interval!")
                         constrangeri_incalcate += 1
                     else:
-                        profs_in_crt_interval.append(prof)
+                        profs_in_crt_interval.add(prof)
 
                     # MATERIA NU SE PREDA IN SALA
                     if subject not in timetable_specs[SALI][room][MATERII]:
@@ -151,8 +161,10 @@ def check_mandatory_constraints(
 
     # CONDITIA DE MAXIM 7 ORE PE SĂPTĂMÂNĂ
     for prof in ore_profesori:
-        if ore_profesori[prof] > 7:
-            print(f"Profesorul {prof} tine mai mult de 7 sloturi!")
+        if ore_profesori[prof] > MAX_SLOTURI_PROFESOR:
+            print(
+                f"Profesorul {prof} tine mai mult de {MAX_SLOTURI_PROFESOR} sloturi!"
+            )
             constrangeri_incalcate += 1
 
     return constrangeri_incalcate
@@ -167,50 +179,239 @@ def check_optional_constraints(
 
     constrangeri_incalcate = 0
 
-    for prof in timetable_specs[PROFESORI]:
-        for const in timetable_specs[PROFESORI][prof][CONSTRANGERI]:
-            if const[0] != "!":
-                continue
-            else:
-                const = const[1:]
-
-                if const in timetable_specs[ZILE]:
-                    day = const
-                    if day in timetable:
-                        for interval in timetable[day]:
-                            for room in timetable[day][interval]:
-                                if timetable[day][interval][room]:
-                                    crt_prof, _ = timetable[day][interval][room]
-                                    if prof == crt_prof:
-                                        print(
-                                            f"Profesorul {prof} nu dorește să predea în ziua {day}!"
-                                        )
-                                        constrangeri_incalcate += 1
-
-                elif "-" in const:
-                    interval = parse_interval(const)
-                    start, end = interval
-
-                    if start != end - 2:
-                        intervals = [(i, i + 2) for i in range(start, end, 2)]
-                    else:
-                        intervals = [(start, end)]
-
-                    for day in timetable:
-                        for interval in intervals:
-                            if interval in timetable[day]:
-                                for room in timetable[day][interval]:
-                                    if timetable[day][interval][room]:
-                                        crt_prof, _ = timetable[day][interval][room]
-                                        if prof == crt_prof:
-                                            print(
-                                                f"Profesorul {prof} nu dorește să predea în intervalul {interval}!"
-                                            )
-                                            constrangeri_incalcate += 1
+    # Constrângerile profesorilor sunt compilate o singură dată, fără restul datelor solverului
+    zile = list(timetable_specs[ZILE])
+    intervale = [
+        parse_interval_string(interval) for interval in timetable_specs[INTERVALE]
+    ]
+    sloturi = [(zi, interval) for zi in zile for interval in intervale]
+    professor_constraints = {
+        prof: ProfessorConstraints.compile(
+            prof_specs[CONSTRANGERI], zile, intervale, sloturi
+        )
+        for prof, prof_specs in timetable_specs[PROFESORI].items()
+    }
+
+    for day in timetable:
+        for interval in timetable[day]:
+            for room in timetable[day][interval]:
+                if not timetable[day][interval][room]:
+                    continue
+
+                prof, _ = timetable[day][interval][room]
+                if prof not in professor_constraints:
+                    continue
+
+                if day in professor_constraints[prof].forbidden_days:
+                    print(f"Profesorul {prof} nu dorește să predea în ziua {day}!")
+                    constrangeri_incalcate += 1
+
+                if interval in professor_constraints[prof].forbidden_intervals:
+                    print(
+                        f"Profesorul {prof} nu dorește să predea în intervalul {interval}!"
+                    )
+                    constrangeri_incalcate += 1
 
     return constrangeri_incalcate
 
 
+class ValidationReport(
+    namedtuple(
+        "ValidationReport",
+        [
+            "profesor_ocupat",
+            "materie_sala",
+            "materie_profesor",
+            "acoperire",
+            "sloturi_profesor",
+            "zi_nedorita",
+            "interval_nedorit",
+        ],
+    )
+):
+    """
+    Numărul de constrângeri încălcate de un orar, pe tipuri (primele 5 sunt obligatorii, ultimele 2 optionale)
+    """
+
+    __slots__ = ()
+
+    def mandatory_violations(self):
+        """
+        Returnează numărul de constrângeri obligatorii încălcate, același cu cel dat de check_mandatory_constraints
+        """
+        return (
+            self.profesor_ocupat
+            + self.materie_sala
+            + self.materie_profesor
+            + self.acoperire
+            + self.sloturi_profesor
+        )
+
+    def optional_violations(self):
+        """
+        Returnează numărul de constrângeri optionale încălcate, același cu cel dat de check_optional_constraints
+        """
+        return self.zi_nedorita + self.interval_nedorit
+
+
+def validate_timetable(timetable, constraints_manager) -> ValidationReport:
+    """
+    Se verifică direct orarul din memorie al unei soluții (dicționar de zile sau TimetableGrid), fără a reciti fișierul de ieșire.
+
+    Se folosesc mulțimile precalculate de constraints_manager și nu se afișează nimic, se returnează numărul de încălcări pe tipuri.
+    """
+
+    if isinstance(timetable, TimetableGrid):
+        return validate_timetable_grid(timetable, constraints_manager)
+
+    profesor_ocupat = materie_sala = materie_profesor = 0
+    zi_nedorita = interval_nedorit = 0
+
+    materii_sala = {
+        room: frozenset(subjects)
+        for room, subjects in constraints_manager.activities_per_room.items()
+    }
+    materii_profesor = constraints_manager.activities_per_prof
+    professor_constraints = constraints_manager.professor_constraints
+    capacitati = constraints_manager.room_capacities
+
+    acoperire_reala = dict.fromkeys(constraints_manager.activities, 0)
+    ore_profesori = dict.fromkeys(constraints_manager.profs, 0)
+
+    for day, intervals in timetable.items():
+        for interval, rooms in intervals.items():
+            profs_in_crt_interval = set()
+
+            for room, assignment in rooms.items():
+                if not assignment:
+                    continue
+
+                prof, subject = assignment
+                acoperire_reala[subject] += capacitati[room]
+                ore_profesori[prof] += 1
+
+                if prof in profs_in_crt_interval:
+                    profesor_ocupat += 1
+                else:
+                    profs_in_crt_interval.add(prof)
+
+                if subject not in materii_sala[room]:
+                    materie_sala += 1
+
+                if subject not in materii_profesor[prof]:
+                    materie_profesor += 1
+
+                if day in professor_constraints[prof].forbidden_days:
+                    zi_nedorita += 1
+
+                if interval in professor_constraints[prof].forbidden_intervals:
+                    interval_nedorit += 1
+
+    acoperire_target = constraints_manager.constraints[MATERII]
+    acoperire = sum(
+        1
+        for subject, students in acoperire_target.items()
+        if acoperire_reala[subject] < students
+    )
+    sloturi_profesor = sum(
+        1 for ore in ore_profesori.values() if ore > MAX_SLOTURI_PROFESOR
+    )
+
+    return ValidationReport(
+        profesor_ocupat,
+        materie_sala,
+        materie_profesor,
+        acoperire,
+        sloturi_profesor,
+        zi_nedorita,
+        interval_nedorit,
+    )
+
+
+def validate_timetable_grid(grid, constraints_manager) -> ValidationReport:
+    """
+    Varianta vectorizată a validate_timetable pentru un TimetableGrid: fiecare tip de constrângere este o reducere NumPy peste celulele ocupate.
+    """
+
+    zile, intervale, sali, profesori, materii = grid.occupied_cells()
+    nr_profesori = len(constraints_manager.profs)
+
+    # Un profesor apare de mai multe ori în același interval dacă perechea (slot, profesor) se repetă
+    sloturi = zile * len(constraints_manager.intervals) + intervale
+    profesor_ocupat = len(profesori) - len(
+        np.unique(sloturi * nr_profesori + profesori)
+    )
+
+    # Matrice booleene de compatibilitate, indexate cu ID-urile din constraints_manager
+    materii_sala = np.array(
+        [
+            [
+                materie in constraints_manager.activities_per_room[sala]
+                for materie in constraints_manager.activities
+            ]
+            for sala in constraints_manager.rooms
+        ],
+        dtype=bool,
+    )
+    materii_profesor = np.array(
+        [
+            [
+                materie in constraints_manager.activities_per_prof[profesor]
+                for materie in constraints_manager.activities
+            ]
+            for profesor in constraints_manager.profs
+        ],
+        dtype=bool,
+    )
+    materie_sala = int(np.count_nonzero(~materii_sala[sali, materii]))
+    materie_profesor = int(np.count_nonzero(~materii_profesor[profesori, materii]))
+
+    acoperire_target = np.array(
+        [
+            constraints_manager.constraints[MATERII][materie]
+            for materie in constraints_manager.activities
+        ]
+    )
+    acoperire = int(np.count_nonzero(grid.covered_students() < acoperire_target))
+    sloturi_profesor = int(
+        np.count_nonzero(grid.professor_load() > MAX_SLOTURI_PROFESOR)
+    )
+
+    constrangeri = [
+        constraints_manager.professor_constraints[profesor]
+        for profesor in constraints_manager.profs
+    ]
+    zile_nedorite = np.array(
+        [
+            [zi in constrangere.forbidden_days for zi in constraints_manager.days]
+            for constrangere in constrangeri
+        ],
+        dtype=bool,
+    )
+    intervale_nedorite = np.array(
+        [
+            [
+                interval in constrangere.forbidden_intervals
+                for interval in constraints_manager.intervals
+            ]
+            for constrangere in constrangeri
+        ],
+        dtype=bool,
+    )
+    zi_nedorita = int(np.count_nonzero(zile_nedorite[profesori, zile]))
+    interval_nedorit = int(np.count_nonzero(intervale_nedorite[profesori, intervale]))
+
+    return ValidationReport(
+        profesor_ocupat,
+        materie_sala,
+        materie_profesor,
+        acoperire,
+        sloturi_profesor,
+        zi_nedorita,
+        interval_nedorit,
+    )
+
+
 if __name__ == "__main__":
 
     if len(sys.argv) == 1:
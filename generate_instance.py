@@ -0,0 +1,283 @@
+import argparse
+import random
+
+import yaml
+
+from structs import ConstraintManager, count_pause_violations
+from utils import *
+
+DAY_NAMES = ["Luni", "Marti", "Miercuri", "Joi", "Vineri", "Sambata", "Duminica"]
+FIRST_NAMES = [
+    "Andrei",
+    "Ana",
+    "Bogdan",
+    "Cristina",
+    "Dan",
+    "Elena",
+    "Florin",
+    "Gabriela",
+    "Ioana",
+    "Mihai",
+    "Nicoleta",
+    "Ovidiu",
+    "Paula",
+    "Radu",
+    "Sorina",
+    "Tudor",
+]
+LAST_NAMES = [
+    "Popescu",
+    "Ionescu",
+    "Dumitrescu",
+    "Stan",
+    "Gheorghe",
+    "Munteanu",
+    "Dinu",
+    "Filipescu",
+    "Marin",
+    "Tudose",
+    "Constantin",
+    "Enache",
+    "Preda",
+    "Lazar",
+]
+CAPACITIES = [25, 30, 40, 50, 60, 75, 100]
+
+FIRST_INTERVAL_START = 8
+INTERVAL_LENGTH = 2
+
+
+def day_names(number_of_days):
+    """Returns the names of the first days of the week, with generic names past Sunday"""
+    return [
+        DAY_NAMES[idx] if idx < len(DAY_NAMES) else f"Ziua{idx + 1}"
+        for idx in range(number_of_days)
+    ]
+
+
+def interval_tuples(number_of_intervals):
+    """Returns consecutive 2 hour intervals starting at 8"""
+    return [
+        (
+            FIRST_INTERVAL_START + idx * INTERVAL_LENGTH,
+            FIRST_INTERVAL_START + (idx + 1) * INTERVAL_LENGTH,
+        )
+        for idx in range(number_of_intervals)
+    ]
+
+
+def professor_names(number_of_profs, rng):
+    """Returns distinct "First Last" professor names"""
+    names = set()
+    while len(names) < number_of_profs:
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        if name in names:
+            name += f" {len(names)}"
+        names.add(name)
+    return sorted(names)
+
+
+def plant_timetable(days, intervals, rooms, profs_subjects, fill, rng):
+    """Builds a random timetable respecting every mandatory constraint, it is the hidden solution of the instance"""
+    timetable = {
+        day: {interval: {room: None for room in rooms} for interval in intervals}
+        for day in days
+    }
+    load = {prof: 0 for prof in profs_subjects}
+    subjects_profs = {}
+    for prof, subjects in profs_subjects.items():
+        for subject in subjects:
+            subjects_profs.setdefault(subject, []).append(prof)
+
+    cells = [
+        (day, interval, room)
+        for day in days
+        for interval in intervals
+        for room in rooms
+    ]
+    rng.shuffle(cells)
+
+    for day, interval, room in cells[: int(len(cells) * fill)]:
+        busy_profs = set()
+        scheduled_subjects = set()
+        for assignment in timetable[day][interval].values():
+            if assignment:
+                busy_profs.add(assignment[0])
+                scheduled_subjects.add(assignment[1])
+
+        # The solvers don't schedule the same subject twice in one interval
+        subjects = [
+            subject for subject in subjects_profs if subject not in scheduled_subjects
+        ]
+        rng.shuffle(subjects)
+
+        for subject in subjects:
+            free_profs = [
+                prof
+                for prof in subjects_profs[subject]
+                if prof not in busy_profs and load[prof] < ConstraintManager.MAX_PROF_SLOTS
+            ]
+            if free_profs:
+                prof = rng.choice(free_profs)
+                timetable[day][interval][room] = (prof, subject)
+                load[prof] += 1
+                break
+
+    return timetable
+
+
+def professor_constraints(prof, days, intervals, planted_slots, tightness, exact, rng):
+    """Returns the Constrangeri list of a professor, in exact instances the planted slots are never forbidden"""
+    taught_days = {day for day, _ in planted_slots}
+    taught_intervals = {interval for _, interval in planted_slots}
+    constraints = []
+
+    for day in days:
+        allowed = exact and day in taught_days
+        if not allowed and rng.random() < tightness:
+            constraints.append(f"!{day}")
+        else:
+            constraints.append(day)
+
+    for start, end in intervals:
+        allowed = exact and (start, end) in taught_intervals
+        if not allowed and rng.random() < tightness:
+            constraints.append(f"!{start}-{end}")
+        else:
+            constraints.append(f"{start}-{end}")
+
+    # Pause constraints are only added if the planted slots respect them
+    if planted_slots and rng.random() < tightness:
+        max_pause = rng.choice([0, 2, 4])
+        if not exact or not count_pause_violations(max_pause, sorted(planted_slots)):
+            constraints.append(f"!Pauza > {max_pause}")
+
+    return constraints
+
+
+def generate_instance(
+    number_of_days=5,
+    number_of_intervals=6,
+    number_of_rooms=4,
+    number_of_profs=20,
+    number_of_subjects=4,
+    tightness=0.3,
+    exact=True,
+    seed=0,
+):
+    """Generates an instance in the input file format and its hidden solution.
+
+    tightness (0 - 1) controls how many cells the hidden solution fills and how many
+    soft constraints the professors have. In exact instances the number of students
+    of every subject is exactly the capacity the hidden solution covers and no soft
+    constraint forbids its slots, otherwise the students are 80% of it and the soft
+    constraints are random.
+    """
+    rng = random.Random(seed)
+
+    days = day_names(number_of_days)
+    intervals = interval_tuples(number_of_intervals)
+    subjects = [f"M{idx + 1}" for idx in range(number_of_subjects)]
+    rooms = [f"S{idx + 1}" for idx in range(number_of_rooms)]
+    profs = professor_names(number_of_profs, rng)
+
+    # Every professor teaches 1 to 3 subjects and every subject has a professor
+    profs_subjects = {
+        prof: set(rng.sample(subjects, rng.randint(1, min(3, len(subjects)))))
+        for prof in profs
+    }
+    for idx, subject in enumerate(subjects):
+        profs_subjects[profs[idx % len(profs)]].add(subject)
+    # Sets of strings iterate in a different order on every run, the seeded choices need a fixed one
+    profs_subjects = {prof: sorted(subjects) for prof, subjects in profs_subjects.items()}
+
+    fill = 0.3 + 0.6 * tightness
+    timetable = plant_timetable(days, intervals, rooms, profs_subjects, fill, rng)
+
+    covered = {subject: 0 for subject in subjects}
+    rooms_subjects = {room: set() for room in rooms}
+    planted_slots = {prof: [] for prof in profs}
+    capacities = {room: rng.choice(CAPACITIES) for room in rooms}
+    for day in days:
+        for interval in intervals:
+            for room, assignment in timetable[day][interval].items():
+                if assignment:
+                    prof, subject = assignment
+                    covered[subject] += capacities[room]
+                    rooms_subjects[room].add(subject)
+                    planted_slots[prof].append((day, interval))
+
+    # Rooms also accept a few subjects that the hidden solution doesn't use
+    for room in rooms:
+        for subject in subjects:
+            if subject not in rooms_subjects[room] and rng.random() < 1 - tightness:
+                rooms_subjects[room].add(subject)
+        if not rooms_subjects[room]:
+            rooms_subjects[room].add(rng.choice(subjects))
+
+    if exact:
+        students = dict(covered)
+    else:
+        students = {subject: int(covered[subject] * 0.8) for subject in subjects}
+
+    yaml_dict = {
+        ZILE: days,
+        INTERVALE: [f"({start}, {end})" for start, end in intervals],
+        MATERII: students,
+        PROFESORI: {
+            prof: {
+                CONSTRANGERI: professor_constraints(
+                    prof, days, intervals, planted_slots[prof], tightness, exact, rng
+                ),
+                MATERII: profs_subjects[prof],
+            }
+            for prof in profs
+        },
+        SALI: {
+            room: {CAPACITATE: capacities[room], MATERII: sorted(rooms_subjects[room])}
+            for room in rooms
+        },
+    }
+
+    return yaml_dict, timetable
+
+
+def main():
+    """Writes a generated instance to a yaml file"""
+    parser = argparse.ArgumentParser(
+        description="Synthetic timetable instance generator"
+    )
+    parser.add_argument("output", help="path of the yaml file to write")
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--intervals", type=int, default=6)
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--profs", type=int, default=20)
+    parser.add_argument("--subjects", type=int, default=4)
+    parser.add_argument(
+        "--tightness", type=float, default=0.3, help="between 0 (loose) and 1 (tight)"
+    )
+    parser.add_argument(
+        "--relaxed",
+        action="store_true",
+        help="leave slack in the coverage instead of an exactly feasible instance",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    yaml_dict, _ = generate_instance(
+        args.days,
+        args.intervals,
+        args.rooms,
+        args.profs,
+        args.subjects,
+        args.tightness,
+        not args.relaxed,
+        args.seed,
+    )
+
+    with open(args.output, "w") as file:
+        yaml.dump(yaml_dict, file, allow_unicode=True)
+
+
+if __name__ == "__main__":
+    main()
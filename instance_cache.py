@@ -0,0 +1,116 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+import yaml
+
+import structs
+from structs import ConstraintManager
+from utils import *
+
+# Bumped whenever the pickled ConstraintManager changes shape, so stale entries are ignored
+CACHE_VERSION = 2
+
+
+def source_hash(module):
+    """Returns a short hash of the source of a module"""
+    with open(module.__file__, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:12]
+
+
+# The pickled classes are defined in structs.py, any change to it invalidates the entries
+# even if CACHE_VERSION wasn't bumped
+STRUCTS_HASH = source_hash(structs)
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ORAR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".instance_cache"),
+)
+
+# Instances already loaded by this process, keyed by content hash, least recently used first
+_instances = OrderedDict()
+
+# Most instances kept in memory, a long-running process forgets the least recently used ones
+MAX_MEMORY_INSTANCES = 8
+
+
+def content_hash(data):
+    """Returns the hash identifying the content of an input file"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def parse_instance(data):
+    """Parses the yaml content of an input file into a ConstraintManager"""
+    yaml_dict = yaml.load(data, Loader=SafeLoader)
+    total_students = sum(yaml_dict[MATERII].values())
+    return ConstraintManager(yaml_dict, total_students)
+
+
+def load_instance(file_path, cache_dir=DEFAULT_CACHE_DIR):
+    """Returns the ConstraintManager of an input file.
+
+    The yaml is parsed at most once per process, and the parsed and compiled instance
+    (interval tuples, IDs, eligibility lists, constraints) is pickled in cache_dir under
+    the hash of the file content and of structs.py, so later processes skip the parsing
+    as well. Pass cache_dir=None to disable the on-disk cache. The returned manager is
+    shared, it must not be modified.
+    """
+    with open(file_path, "rb") as file:
+        return load_instance_data(file.read(), cache_dir)
+
+
+def load_instance_data(data, cache_dir=DEFAULT_CACHE_DIR):
+    """Returns the ConstraintManager of the yaml content of an input file, cached like load_instance"""
+    if isinstance(data, str):
+        data = data.encode()
+    key = content_hash(data)
+
+    if key in _instances:
+        _instances.move_to_end(key)
+        return _instances[key]
+
+    constraints_manager = None
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            cache_dir, f"{key}.v{CACHE_VERSION}.{STRUCTS_HASH}.pickle"
+        )
+        constraints_manager = read_cache_entry(cache_path)
+
+    if constraints_manager is None:
+        constraints_manager = parse_instance(data)
+        if cache_path is not None:
+            write_cache_entry(cache_path, constraints_manager)
+
+    _instances[key] = constraints_manager
+    if len(_instances) > MAX_MEMORY_INSTANCES:
+        _instances.popitem(last=False)
+    return constraints_manager
+
+
+def read_cache_entry(cache_path):
+    """Returns the ConstraintManager pickled at cache_path, or None if it can't be read"""
+    try:
+        with open(cache_path, "rb") as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+
+def write_cache_entry(cache_path, constraints_manager):
+    """Pickles a ConstraintManager at cache_path, a failed write only loses the cache"""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Written to a temporary file first, so concurrent processes never read half an entry
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            pickle.dump(constraints_manager, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        pass
+
+
+def clear_memory_cache():
+    """Forgets the instances loaded by this process"""
+    _instances.clear()
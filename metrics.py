@@ -0,0 +1,180 @@
+import atexit
+import contextlib
+import cProfile
+import functools
+import io
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+
+
+class Metrics:
+    """Counts the calls and accumulates the time spent in the hot paths of a search"""
+
+    enabled = True
+
+    def __init__(self):
+        """Constructor for the Metrics class"""
+        self.calls = defaultdict(int)
+        self.times = defaultdict(float)
+        self.restarts = []
+        self.expansions = []
+
+    def add(self, name, elapsed):
+        """Records one call of `name` that took `elapsed` seconds"""
+        self.calls[name] += 1
+        self.times[name] += elapsed
+
+    def count(self, name, number=1):
+        """Counts calls of `name` without timing them"""
+        self.calls[name] += number
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Times the body of a with statement as one call of `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def record_restart(self, **stats):
+        """Records the statistics of one hill climbing restart"""
+        self.restarts.append(stats)
+
+    def record_expansion(self, **stats):
+        """Records the statistics of one A* expansion"""
+        self.expansions.append(stats)
+
+    def merge(self, other):
+        """Adds the counters of another Metrics object, e.g. one of a worker process"""
+        for name, calls in other.calls.items():
+            self.calls[name] += calls
+        for name, elapsed in other.times.items():
+            self.times[name] += elapsed
+        self.restarts.extend(other.restarts)
+        self.expansions.extend(other.expansions)
+
+    def reset(self):
+        """Clears every counter"""
+        self.__init__()
+
+    def to_dict(self):
+        """Returns the counters as plain dictionaries"""
+        return {
+            "calls": dict(self.calls),
+            "times": dict(self.times),
+            "restarts": self.restarts,
+            "expansions": self.expansions,
+        }
+
+    def report(self):
+        """Returns a table with the calls and time of every instrumented path"""
+        lines = [f"{'Path':<30}{'Calls':>12}{'Total (s)':>12}{'Per call (us)':>16}"]
+        for name in sorted(self.calls, key=lambda name: -self.times.get(name, 0.0)):
+            calls = self.calls[name]
+            elapsed = self.times.get(name, 0.0)
+            per_call = elapsed / calls * 1e6 if calls else 0.0
+            lines.append(f"{name:<30}{calls:>12}{elapsed:>12.3f}{per_call:>16.2f}")
+
+        if self.restarts:
+            lines.append(f"Restarts: {len(self.restarts)}")
+            for stats in self.restarts:
+                lines.append("  " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        if self.expansions:
+            lines.append(f"Expansions: {len(self.expansions)}")
+
+        return "\n".join(lines)
+
+
+class NullMetrics(Metrics):
+    """Metrics that record nothing, used when instrumentation is off"""
+
+    enabled = False
+
+    def add(self, name, elapsed):
+        pass
+
+    def count(self, name, number=1):
+        pass
+
+    def timer(self, name):
+        return contextlib.nullcontext()
+
+    def record_restart(self, **stats):
+        pass
+
+    def record_expansion(self, **stats):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def instrument(cls, method_names):
+    """Wraps methods of a class so every call is timed into `self.metrics`.
+
+    Classes are only wrapped when instrumentation is requested, so the hot paths
+    keep their normal cost otherwise.
+    """
+    for name in method_names:
+        method = getattr(cls, name)
+        if getattr(method, "__instrumented__", False):
+            continue
+
+        def make_wrapper(method, name):
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                metrics = self.metrics
+                if not metrics.enabled:
+                    return method(self, *args, **kwargs)
+
+                start = time.perf_counter()
+                try:
+                    return method(self, *args, **kwargs)
+                finally:
+                    metrics.add(name, time.perf_counter() - start)
+
+            wrapper.__instrumented__ = True
+            return wrapper
+
+        setattr(cls, name, make_wrapper(method, name))
+
+
+class Profiler:
+    """Runs cProfile and tracemalloc for the whole process and prints a report at exit"""
+
+    def __init__(self, metrics=None, top=25):
+        """Constructor for the Profiler class"""
+        self.metrics = metrics
+        self.top = top
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        """Starts profiling and registers the report for when the process exits"""
+        tracemalloc.start()
+        self.profile.enable()
+        atexit.register(self.dump)
+
+    def dump(self):
+        """Stops profiling and prints the report"""
+        self.profile.disable()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.top)
+
+        print("\n----------- Profile -----------")
+        print(stream.getvalue())
+        print("----------- Memory -----------")
+        print(f"Peak traced memory: {peak_memory / 2**20:.2f} MiB")
+        for stat in snapshot.statistics("lineno")[: self.top // 2]:
+            print(stat)
+
+        if self.metrics is not None:
+            print("\n----------- Hot paths -----------")
+            print(self.metrics.report())
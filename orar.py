@@ -1,10 +1,41 @@
 import os
-from structs import TimetableNode, ConstraintManager
-from algorithms import RandomRestartHillClimbing, AStarSearch
+from structs import (
+    TimetableNode,
+    ConstraintManager,
+    parse_interval_string,
+    instrument_timetable_node,
+)
+from metrics import Metrics, Profiler
+from search_log import SearchLog, LEVELS, DEFAULT_EVERY, DEFAULT_INTERVAL
+from instance_cache import load_instance
+from check_constraints import validate_timetable
+from algorithms import (
+    RandomRestartHillClimbing,
+    AStarSearch,
+    TabuSearch,
+    SimulatedAnnealing,
+    BacktrackingSearch,
+    BeamSearch,
+)
+from timetable_grid import TimetableGrid
 from utils import *
 
 MAX_HC_ITERATIONS = 10000
 MAX_RESTARTS = 20
+MAX_TABU_ITERATIONS = 20000
+TABU_TENURE = 20
+MAX_SA_ITERATIONS = 200000
+BEAM_WIDTH = 4
+
+# Algorithms that can be run, with the name printed when they start
+ALGORITHM_NAMES = {
+    "hc": "Hill Climbing",
+    "astar": "A*",
+    "tabu": "Tabu Search",
+    "sa": "Simulated Annealing",
+    "bt": "Backtracking",
+    "beam": "Beam Search",
+}
 
 def create_days_dict(yaml_dict):
     """Creates the days dictionary from the yaml dictionary"""
@@ -12,15 +43,7 @@ def create_days_dict(yaml_dict):
     for day_name in yaml_dict[ZILE]:
         intervals = {}
         for interval_string in yaml_dict[INTERVALE]:
-            interval_start, interval_end = interval_string.split(",")
-
-            # Strip interval start and end of ()
-            interval_start = interval_start[1:]
-            interval_end = interval_end[:-1]
-
-            # Make them integers
-            interval_start = int(interval_start)
-            interval_end = int(interval_end)
+            interval_start, interval_end = parse_interval_string(interval_string)
 
             # Create the assignments dictionary
             assignments = {}
@@ -31,6 +54,11 @@ def create_days_dict(yaml_dict):
     return days
 
 
+def create_days_grid(constraints_manager):
+    """Creates the compact, array backed, days timetable"""
+    return TimetableGrid(constraints_manager)
+
+
 def create_professors_dict(yaml_dict):
     """Creates the professors dictionary from the yaml dictionary"""
     profs = {}
@@ -39,18 +67,231 @@ def create_professors_dict(yaml_dict):
     return profs
 
 
-def write_result_to_file(result, input_dir, output_dir, filename):
-    """Writes the result to a file"""
-    table_str = pretty_print_timetable(result.days, input_dir + filename + ".yaml")
+# Writers of the output formats, the format is also the extension of the output file
+OUTPUT_WRITERS = {
+    "txt": lambda result, file: write_timetable(
+        result.days, result.constraints_manager.profs, file
+    ),
+    "json": lambda result, file: write_timetable_json(result.days, file),
+    "csv": lambda result, file: write_timetable_csv(result.days, file),
+}
+
+
+def write_result_to_file(result, input_dir, output_dir, filename, formats=("txt",)):
+    """Writes the result to a file for every output format"""
+    for output_format in formats:
+        with open(
+            output_dir + filename + "." + output_format, "w", newline=""
+        ) as file:
+            OUTPUT_WRITERS[output_format](result, file)
+
+
+def create_initial_node(yaml_dict, array_state=False, constraints_manager=None):
+    """Creates the initial (empty timetable) node from the yaml dictionary, reusing an already built constraints manager if given"""
+    # Create the professors dictionary
+    profs = create_professors_dict(yaml_dict)
+
+    if constraints_manager is None:
+        # Compute number of initial total students
+        total_students = 0
+        for subject in yaml_dict[MATERII]:
+            total_students += yaml_dict[MATERII][subject]
+
+        constraints_manager = ConstraintManager(yaml_dict, total_students)
+
+    # Create the days timetable
+    if array_state:
+        days = create_days_grid(constraints_manager)
+    else:
+        days = create_days_dict(yaml_dict)
+
+    return TimetableNode(
+        constraints_manager, dict(yaml_dict[MATERII]), days, profs
+    )
+
+
+def print_search_progress(progress):
+    """Prints the elapsed time and when the best cost was reached"""
+    print(f"Elapsed time: {progress.elapsed_time:.2f} seconds")
+    if progress.best_cost_time is not None:
+        print(
+            f"Best cost: {progress.best_cost} reached after "
+            f"{progress.best_cost_time:.2f} seconds (step {progress.best_cost_step})"
+        )
+
+
+def solve(
+    algorithm,
+    initial_node,
+    time_limit=None,
+    workers=1,
+    vectorized_scoring=False,
+    log=None,
+    cooling="geometric",
+    beam_width=BEAM_WIDTH,
+    max_open_nodes=None,
+    memory_budget=None,
+):
+    """Runs an algorithm from the initial node, returns the result and the search object"""
+    if algorithm == "hc":
+        engine = RandomRestartHillClimbing(
+            MAX_RESTARTS,
+            MAX_HC_ITERATIONS,
+            initial_node,
+            vectorized_scoring=vectorized_scoring,
+            workers=workers,
+            time_limit=time_limit,
+            log=log,
+        )
+        result, _ = engine.random_restart_hill_climbing()
+    elif algorithm == "astar":
+        engine = AStarSearch(
+            initial_node,
+            time_limit=time_limit,
+            log=log,
+            max_open_nodes=max_open_nodes,
+            memory_budget=memory_budget,
+        )
+        result = engine.search()
+    elif algorithm == "tabu":
+        engine = TabuSearch(
+            initial_node,
+            max_iterations=MAX_TABU_ITERATIONS,
+            tenure=TABU_TENURE,
+            time_limit=time_limit,
+            log=log,
+        )
+        result = engine.search()
+    elif algorithm == "sa":
+        engine = SimulatedAnnealing(
+            initial_node,
+            max_iterations=MAX_SA_ITERATIONS,
+            cooling=cooling,
+            time_limit=time_limit,
+            log=log,
+        )
+        result = engine.search()
+    elif algorithm == "beam":
+        engine = BeamSearch(
+            initial_node,
+            width=beam_width,
+            workers=workers,
+            time_limit=time_limit,
+            log=log,
+        )
+        result = engine.search()
+    elif algorithm == "bt":
+        engine = BacktrackingSearch(initial_node, time_limit=time_limit, log=log)
+        result = engine.search()
+    else:
+        raise ValueError(f"Unknown algorithm {algorithm}")
+
+    return result, engine
+
 
-    with open(output_dir + filename + ".txt", "w") as file:
-        file.write(table_str)
+def print_validation(result):
+    """Validates the result in memory and prints the violations like check_constraints does"""
+    report = validate_timetable(result.days, result.constraints_manager)
+    print(f"S-au încălcat {report.mandatory_violations()} constrângeri obligatorii!")
+    print(f"S-au încălcat {report.optional_violations()} constrângeri optionale!")
+    return report
 
 
 def __init__():
     """Main function"""
-    algorithm = sys.argv[1]
-    filename = sys.argv[2]
+    parser = argparse.ArgumentParser(description="Timetable scheduler")
+    parser.add_argument("algorithm", help=" or ".join(ALGORITHM_NAMES))
+    parser.add_argument("filename", help="name of the input file from inputs/")
+    parser.add_argument(
+        "--array-state",
+        action="store_true",
+        help="store the timetable in a numpy array instead of nested dicts",
+    )
+    parser.add_argument(
+        "--vectorized-scoring",
+        action="store_true",
+        help="score the hill climbing moves in one numpy pass",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes running the hill climbing restarts or expanding the beam in parallel",
+    )
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        default=None,
+        help="time budget in seconds, the best timetable so far is returned when it expires",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="count calls and time of the search hot paths and print them at the end",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="run cProfile and tracemalloc and print a report at exit (implies --metrics)",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=list(LEVELS),
+        default="quiet",
+        help="quiet prints the summary, progress adds rate limited progress lines, debug a line per node",
+    )
+    parser.add_argument(
+        "--log-every",
+        type=int,
+        default=DEFAULT_EVERY,
+        help="print a progress line every N steps",
+    )
+    parser.add_argument(
+        "--log-interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help="print a progress line at least every N seconds",
+    )
+    parser.add_argument(
+        "--output-format",
+        nargs="+",
+        choices=list(OUTPUT_WRITERS),
+        default=["txt"],
+        help="formats of the files written in outputs/",
+    )
+    parser.add_argument(
+        "--cooling",
+        choices=SimulatedAnnealing.COOLING_SCHEDULES,
+        default="geometric",
+        help="cooling schedule of the simulated annealing",
+    )
+    parser.add_argument(
+        "--beam-width",
+        type=int,
+        default=BEAM_WIDTH,
+        help="number of partial timetables kept at every depth of the beam search",
+    )
+    parser.add_argument(
+        "--max-open-nodes",
+        type=int,
+        default=None,
+        help="bound of the A* open set, the entries with the highest f are dropped past it",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="bound of the estimated A* open set memory in MiB, the entries with the highest f are dropped past it",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="check the constraints of the result in memory and print the violations",
+    )
+    args = parser.parse_args()
+
+    algorithm = args.algorithm
+    filename = args.filename
     input_dir = "inputs/"
     output_dir = "outputs/"
 
@@ -59,43 +300,57 @@ def __init__():
         print("File not found")
         return
 
-    # Read the yaml file
-    yaml_dict = read_yaml_file(input_dir + filename + ".yaml")
+    if algorithm not in ALGORITHM_NAMES:
+        print("Algorithm not implemented")
+        return
+
+    # Load the parsed instance, from the on-disk cache if the file was seen before
+    constraints_manager = load_instance(input_dir + filename + ".yaml")
+    yaml_dict = constraints_manager.constraints
 
-    # Create the days and professors dictionaries
-    days = create_days_dict(yaml_dict)
+    # Create the initial node
+    initial_node = create_initial_node(
+        yaml_dict, args.array_state, constraints_manager
+    )
 
-    # Create the professors dictionary
-    profs = create_professors_dict(yaml_dict)
+    # Instrumentation of the hot paths, passed on by every node to the nodes built from it
+    metrics = None
+    if args.metrics or args.profile:
+        metrics = Metrics()
+        initial_node.metrics = metrics
+        instrument_timetable_node()
+    if args.profile:
+        Profiler(metrics).start()
 
-    # Compute number of initial total students
-    total_students = 0
-    for subject in yaml_dict[MATERII]:
-        total_students += yaml_dict[MATERII][subject]
+    log = SearchLog(args.log_level, args.log_every, args.log_interval)
 
-    # Create the initial node
-    constraints_manager = ConstraintManager(yaml_dict, total_students)
-    initial_node = TimetableNode(constraints_manager, yaml_dict[MATERII], days, profs)
+    print(f"{ALGORITHM_NAMES[algorithm]}...")
+    result, engine = solve(
+        algorithm,
+        initial_node,
+        time_limit=args.time_limit,
+        workers=args.workers,
+        vectorized_scoring=args.vectorized_scoring,
+        log=log,
+        cooling=args.cooling,
+        beam_width=args.beam_width,
+        max_open_nodes=args.max_open_nodes,
+        memory_budget=None if args.memory_budget is None else int(args.memory_budget * 2**20),
+    )
 
-    if algorithm == "hc":
-        print("Hill Climbing...")
-        hill_climbing = RandomRestartHillClimbing(
-            MAX_RESTARTS, MAX_HC_ITERATIONS, initial_node
-        )
-        result, total_iterations = hill_climbing.random_restart_hill_climbing()
-        
-        print(f"Total iterations: {total_iterations}")
-        write_result_to_file(result, input_dir, output_dir, filename)
-        
-    elif algorithm == "astar":
-        print("A*...")
-        astar = AStarSearch(initial_node)
-        result = astar.search()
-        
-        write_result_to_file(result, input_dir, output_dir, filename)
-        
+    if algorithm != "astar":
+        print(f"Total iterations: {engine.total_iterations}")
+    print_search_progress(engine.progress)
+    if result is None:
+        print("No timetable to write")
     else:
-        print("Algorithm not implemented")
+        write_result_to_file(result, input_dir, output_dir, filename, args.output_format)
+        if args.validate:
+            print_validation(result)
+
+    if args.metrics and not args.profile:
+        print(metrics.report())
 
 
-__init__()
+if __name__ == "__main__":
+    __init__()
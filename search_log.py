@@ -0,0 +1,66 @@
+import time
+
+QUIET = 0
+PROGRESS = 1
+DEBUG = 2
+
+LEVELS = {"quiet": QUIET, "progress": PROGRESS, "debug": DEBUG}
+
+DEFAULT_EVERY = 1000
+DEFAULT_INTERVAL = 1.0
+
+
+class SearchLog:
+    """Levelled logging of a search.
+
+    Summary lines are always printed. Progress lines are rate limited to one every
+    `every` steps or every `interval` seconds, and debug lines are printed for every
+    step. Fields passed as callables are only evaluated when the line is printed, so
+    below their level the calls cost a comparison and nothing is formatted.
+    """
+
+    def __init__(self, level=QUIET, every=DEFAULT_EVERY, interval=DEFAULT_INTERVAL):
+        """Constructor for the SearchLog class, level is QUIET, PROGRESS or DEBUG"""
+        self.level = LEVELS[level] if isinstance(level, str) else level
+        self.every = every
+        self.interval = interval
+        self.steps = 0
+        self.last_time = time.perf_counter()
+
+    def enabled(self, level):
+        """Returns True if lines of the given level are printed"""
+        return self.level >= level
+
+    def due(self):
+        """Counts a step and returns True if a progress line should be printed now"""
+        if self.level < PROGRESS:
+            return False
+
+        self.steps += 1
+        now = time.perf_counter()
+        if self.steps % self.every == 0 or now - self.last_time >= self.interval:
+            self.last_time = now
+            return True
+        return False
+
+    def info(self, message):
+        """Prints a summary line, whatever the level"""
+        print(message)
+
+    def progress(self, event, **fields):
+        """Prints a progress line, to be called when due() returned True"""
+        if self.level >= PROGRESS:
+            self.emit(event, fields)
+
+    def debug(self, event, **fields):
+        """Prints a debug line"""
+        if self.level >= DEBUG:
+            self.emit(event, fields)
+
+    def emit(self, event, fields):
+        """Prints an event as `[event] key=value ...`, evaluating the callable fields"""
+        values = " ".join(
+            f"{key}={value() if callable(value) else value}"
+            for key, value in fields.items()
+        )
+        print(f"[{event}] {values}")
@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import signal
+import socket
+import socketserver
+import sys
+import time
+
+from check_constraints import validate_timetable
+from instance_cache import load_instance, load_instance_data
+from orar import (
+    ALGORITHM_NAMES,
+    OUTPUT_WRITERS,
+    create_initial_node,
+    solve,
+    write_result_to_file,
+)
+from search_log import SearchLog
+from utils import timetable_to_json
+
+INPUT_DIR = "inputs/"
+OUTPUT_DIR = "outputs/"
+
+
+def load_request_instance(request):
+    """Returns the ConstraintManager of a request, from "yaml" (inline content) or "input" (a path or a name from inputs/)"""
+    if "yaml" in request:
+        return load_instance_data(request["yaml"])
+
+    input_path = request["input"]
+    if not os.path.isfile(input_path):
+        input_path = INPUT_DIR + input_path + ".yaml"
+    return load_instance(input_path)
+
+
+def handle_request(request):
+    """Solves one request and returns its response.
+
+    A request is a dictionary with the instance ("input" or "yaml"), and optionally
+    "algorithm" (hc by default), "time_limit" in seconds, "seed", "workers",
+    "array_state", "timetable" (to send back the assignments) and "output"
+    (formats written to outputs/<input>.<format>, only for requests by input name).
+    """
+    algorithm = request.get("algorithm", "hc")
+    if algorithm not in ALGORITHM_NAMES:
+        raise ValueError(f"Unknown algorithm {algorithm}")
+    output_formats = request.get("output")
+    if output_formats is not None and (
+        not isinstance(output_formats, list)
+        or any(output_format not in OUTPUT_WRITERS for output_format in output_formats)
+    ):
+        raise ValueError(
+            f"output must be a list of formats among {', '.join(OUTPUT_WRITERS)}"
+        )
+
+    start_time = time.perf_counter()
+    constraints_manager = load_request_instance(request)
+    load_time = time.perf_counter() - start_time
+
+    initial_node = create_initial_node(
+        constraints_manager.constraints,
+        request.get("array_state", False),
+        constraints_manager,
+    )
+
+    if "seed" in request:
+        random.seed(request["seed"])
+    result, engine = solve(
+        algorithm,
+        initial_node,
+        time_limit=request.get("time_limit"),
+        workers=request.get("workers", 1),
+        log=SearchLog(),
+    )
+    if result is None:
+        raise RuntimeError("No solution found")
+
+    report = validate_timetable(result.days, constraints_manager)
+    response = {
+        "algorithm": algorithm,
+        "remaining_students": result.get_remaining_students(),
+        "mandatory_violations": report.mandatory_violations(),
+        "optional_violations": report.optional_violations(),
+        "elapsed_time": engine.progress.elapsed_time,
+        "timed_out": engine.progress.timed_out,
+        "load_time": load_time,
+    }
+
+    if request.get("timetable"):
+        response["timetable"] = timetable_to_json(result.days)
+
+    if output_formats and "input" in request:
+        filename = os.path.splitext(os.path.basename(request["input"]))[0]
+        write_result_to_file(result, INPUT_DIR, OUTPUT_DIR, filename, output_formats)
+
+    return response
+
+
+def serve_lines(lines, respond):
+    """Answers every JSON line of a stream, an invalid or failed request gets an error response"""
+    for line in lines:
+        if not line.strip():
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            # The solvers print their summary, it must not end up in the responses
+            with contextlib.redirect_stdout(sys.stderr):
+                response = handle_request(request)
+            response["ok"] = True
+        except Exception as error:
+            response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+
+        response["id"] = request_id
+        respond(json.dumps(response, ensure_ascii=False))
+
+
+class SolverRequestHandler(socketserver.StreamRequestHandler):
+    """Answers the JSON lines of one connection to the Unix socket"""
+
+    def handle(self):
+        def respond(response):
+            self.wfile.write(response.encode() + b"\n")
+            self.wfile.flush()
+
+        serve_lines((line.decode() for line in self.rfile), respond)
+
+
+def serve_socket(socket_path):
+    """Serves requests on a Unix socket, one connection at a time since the solvers use the global random state"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    # Stopping the service with SIGTERM also removes the socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    with socketserver.UnixStreamServer(socket_path, SolverRequestHandler) as server:
+        print(f"Solver service listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+def serve_stdin():
+    """Serves requests read from stdin, the responses are written to stdout"""
+    stdout = sys.stdout
+
+    def respond(response):
+        stdout.write(response + "\n")
+        stdout.flush()
+
+    serve_lines(sys.stdin, respond)
+
+
+def request_solution(socket_path, **request):
+    """Client side: sends one request to a running service and returns its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode() + b"\n")
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile("rb") as responses:
+            return json.loads(responses.readline())
+
+
+def main():
+    """Starts the solver service"""
+    parser = argparse.ArgumentParser(
+        description="Resident timetable solver answering JSON lines requests"
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="path of the Unix socket to listen on, stdin/stdout are used if missing",
+    )
+    args = parser.parse_args()
+
+    if args.socket:
+        serve_socket(args.socket)
+    else:
+        serve_stdin()
+
+
+if __name__ == "__main__":
+    main()
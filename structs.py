@@ -1,8 +1,40 @@
+import bisect
+from collections import namedtuple
 import copy
-from functools import lru_cache
 import random
+from metrics import NULL_METRICS, instrument
+from timetable_grid import TimetableGrid
 from utils import *
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ZOBRIST_SEED = 2024
+MASK64 = (1 << 64) - 1
+
+# TimetableNode methods timed when instrumentation is on
+INSTRUMENTED_METHODS = [
+    "get_next_moves",
+    "get_next_states",
+    "check_constraint",
+    "choose_move",
+    "eval_node",
+    "eval_move",
+    "eval_moves",
+    "clone",
+    "apply_move",
+]
+
+
+def splitmix64(value):
+    """Returns the splitmix64 mix of an integer, a well spread 64 bit value"""
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
 
 def count_pause_violations(imposed_max_pause, prof_assignments):
     """Returns the number of pause violations for a professor. The prof_assignments list should be sorted by day and interval."""
@@ -25,43 +57,223 @@ def count_pause_violations(imposed_max_pause, prof_assignments):
     return len(bigger_pauses)
 
 
+def parse_interval_string(interval_string):
+    """Parses an interval of the form "(8, 10)" into a tuple of integers"""
+    interval_start, interval_end = interval_string.split(",")
+    return int(interval_start.strip()[1:]), int(interval_end.strip()[:-1])
+
+
+class ProfessorConstraints:
+    """Compiled form of the soft constraints (`Constrangeri`) of a professor"""
+
+    # Cost of teaching in a forbidden day / interval, as used by the search
+    DAY_PENALTY = 3
+    INTERVAL_PENALTY = 1
+
+    def __init__(self, forbidden_days, forbidden_intervals, max_pause, slots):
+        """Constructor for the ProfessorConstraints class"""
+        self.forbidden_days = frozenset(forbidden_days)
+        self.forbidden_intervals = frozenset(forbidden_intervals)
+        self.max_pause = max_pause
+
+        # Bitmask over the slot indexes where the professor doesn't want to teach
+        # and the search penalty of every slot
+        self.forbidden_slots = 0
+        self.slot_penalties = []
+        for slot_idx, (day_name, interval_tuple) in enumerate(slots):
+            penalty = 0
+            if day_name in self.forbidden_days:
+                penalty += self.DAY_PENALTY
+            if interval_tuple in self.forbidden_intervals:
+                penalty += self.INTERVAL_PENALTY
+            if penalty:
+                self.forbidden_slots |= 1 << slot_idx
+            self.slot_penalties.append(penalty)
+
+    @staticmethod
+    def compile(raw_constraints, days, intervals, slots):
+        """Parses the raw constraint strings ("!Luni", "!10-14", "!Pauza > 2") of a professor"""
+        forbidden_days = set()
+        forbidden_intervals = set()
+        max_pause = None
+
+        for constraint in raw_constraints:
+            if not constraint.startswith("!"):
+                continue
+            constraint = constraint[1:]
+
+            # Interval not preferred constraint
+            if "-" in constraint:
+                start, end = constraint.split("-")
+                start, end = int(start), int(end)
+                for interval_tuple in intervals:
+                    if start <= interval_tuple[0] <= interval_tuple[1] <= end:
+                        forbidden_intervals.add(interval_tuple)
+            # Pause not preferred constraint
+            elif ">" in constraint:
+                pause = int(constraint.split()[2])
+                max_pause = pause if max_pause is None else min(max_pause, pause)
+            # Day not preferred constraint
+            elif constraint in days:
+                forbidden_days.add(constraint)
+
+        return ProfessorConstraints(forbidden_days, forbidden_intervals, max_pause, slots)
+
+    def is_forbidden(self, slot_idx):
+        """Returns True if the professor doesn't want to teach in the given slot"""
+        return (self.forbidden_slots >> slot_idx) & 1 == 1
+
+
 class ConstraintManager:
     """Class that handles constraints shared across all TimetableNodes"""
 
+    # Most slots a professor can teach in a week (hard constraint)
+    MAX_PROF_SLOTS = 7
+
     def __init__(self, constraints, initial_total_students):
         self.constraints = constraints
         self.initial_total_students = initial_total_students
 
-    @lru_cache(maxsize=None)
+        # Slots are (day, interval) pairs indexed in the order of the input file
+        self.days = list(constraints[ZILE])
+        self.intervals = [
+            parse_interval_string(interval_string)
+            for interval_string in constraints[INTERVALE]
+        ]
+        self.slots = [
+            (day_name, interval_tuple)
+            for day_name in self.days
+            for interval_tuple in self.intervals
+        ]
+        self.slot_index = {slot: idx for idx, slot in enumerate(self.slots)}
+
+        # Integer IDs used by the compact (array backed) timetable representation
+        self.rooms = list(constraints[SALI])
+        self.profs = list(constraints[PROFESORI])
+        self.activities = list(constraints[MATERII])
+        self.day_ids = {day_name: idx for idx, day_name in enumerate(self.days)}
+        self.interval_ids = {
+            interval_tuple: idx for idx, interval_tuple in enumerate(self.intervals)
+        }
+        self.room_ids = {room: idx for idx, room in enumerate(self.rooms)}
+        self.prof_ids = {prof: idx for idx, prof in enumerate(self.profs)}
+        self.activity_ids = {
+            activity: idx for idx, activity in enumerate(self.activities)
+        }
+
+        # Eligibility lists, so candidate generation only iterates over what can be assigned
+        self.room_capacities = {
+            room: constraints[SALI][room][CAPACITATE] for room in self.rooms
+        }
+        self.activities_per_room = {
+            room: list(constraints[SALI][room][MATERII]) for room in self.rooms
+        }
+        self.activities_per_prof = {
+            prof: frozenset(constraints[PROFESORI][prof][MATERII]) for prof in self.profs
+        }
+        self.profs_per_activity = {
+            activity: [
+                prof for prof in self.profs if activity in self.activities_per_prof[prof]
+            ]
+            for activity in self.activities
+        }
+        self.rooms_per_activity = {
+            activity: [
+                room for room in self.rooms if activity in self.activities_per_room[room]
+            ]
+            for activity in self.activities
+        }
+
+        # Zobrist keys of the (cell, prof) and (cell, activity) pairs are derived on demand
+        # from their index, a timetable's hash is the xor of the keys of its assignments.
+        # They only depend on the seed, so the hashes are the same in every process
+        # working on the same input, and nothing has to be stored or pickled.
+        self.zobrist_prof_seed = splitmix64(ZOBRIST_SEED)
+        self.zobrist_activity_seed = splitmix64(self.zobrist_prof_seed)
+
+        # Compile the professors' constraints once instead of parsing them on every evaluation
+        self.professor_constraints = {
+            prof: ProfessorConstraints.compile(
+                prof_specs[CONSTRANGERI], self.days, self.intervals, self.slots
+            )
+            for prof, prof_specs in constraints[PROFESORI].items()
+        }
+
+        # Penalty tables, built on first use. They are stored on the manager rather than in
+        # a method cache, which would keep every manager ever used alive
+        self._penalty_table = None
+        self._penalty_array = None
+
+    def zobrist_key(self, day_name, interval_tuple, room, prof, activity):
+        """Returns the Zobrist key of an assignment"""
+        cell = self.slot_index[(day_name, interval_tuple)] * len(self.rooms) + self.room_ids[
+            room
+        ]
+        return self.zobrist_cell_key(
+            cell, self.prof_ids[prof], self.activity_ids[activity]
+        )
+
+    def zobrist_cell_key(self, cell, prof_id, activity_id):
+        """Returns the Zobrist key of an assignment given by cell index and IDs"""
+        return splitmix64(
+            self.zobrist_prof_seed ^ (cell * len(self.profs) + prof_id)
+        ) ^ splitmix64(
+            self.zobrist_activity_seed ^ (cell * len(self.activities) + activity_id)
+        )
+
+    def penalty_table(self):
+        """Returns the search penalty of every slot for every professor, indexed [prof ID][slot index]"""
+        if self._penalty_table is None:
+            self._penalty_table = [
+                self.professor_constraints[prof].slot_penalties for prof in self.profs
+            ]
+        return self._penalty_table
+
+    def penalty_array(self):
+        """Returns the penalty table as a NumPy array, used by the vectorized scoring"""
+        if self._penalty_array is None:
+            self._penalty_array = np.asarray(self.penalty_table(), dtype=np.int64)
+        return self._penalty_array
+
     def compute_number_of_accepted_activities_per_place(self, place):
         """Returns the number of accepted activities per place"""
-        number = 0
-        for activity in self.constraints[SALI][place][MATERII]:
-            number += 1
-        return number
+        return len(self.activities_per_room[place])
 
-    @lru_cache(maxsize=None)
     def number_of_places_accepting_activity(self, activity):
         """Returns the number of places accepting the activity"""
-        number = 0
-        for place in self.constraints[SALI]:
-            if activity in self.constraints[SALI][place][MATERII]:
-                number += 1
-        return number
+        return len(self.rooms_per_activity[activity])
 
-    @lru_cache(maxsize=None)
     def get_total_number_of_students(self):
         """Returns the total number of students"""
         return self.initial_total_students
 
-    @lru_cache(maxsize=None)
     def number_of_profs_accepting_activity(self, activity):
         """Returns the number of professors accepting the activity"""
-        number = 0
-        for prof in self.constraints[PROFESORI]:
-            if activity in self.constraints[PROFESORI][prof][MATERII]:
-                number += 1
-        return number
+        return len(self.profs_per_activity[activity])
+
+
+class Move(
+    namedtuple(
+        "Move",
+        [
+            "day",
+            "interval",
+            "room",
+            "prof",
+            "activity",
+            "covered_students",
+            "soft_delta",
+            "pause_delta",
+        ],
+    )
+):
+    """Immutable record of an assignment that can be made from a node, with its cost delta"""
+
+    __slots__ = ()
+
+    def assignment(self):
+        """Returns the move as a (day, interval, room, prof, activity) assignment"""
+        return (self.day, self.interval, self.room, self.prof, self.activity)
 
 
 class TimetableNode:
@@ -74,45 +286,208 @@ class TimetableNode:
         days: dict[str, dict[str, dict[str, (str, str)]]],
         professors: dict[str, int],
         chosen_assignment=None,
-        profs_assignments: dict[str, list] = {},
+        profs_assignments: dict[str, list] = None,
+        totals: tuple[int, int, int, int] = None,
+        busy_profs: dict[tuple, set] = None,
+        scheduled_activities: dict[tuple, set] = None,
+        zobrist_hash: int = None,
+        metrics=NULL_METRICS,
     ):
         """Constructor for the TimetableNode class"""
         self.constraints_manager = constraints_manager
+        # Instrumentation shared by all the nodes of a search, the constraints manager
+        # can be shared by several searches
+        self.metrics = metrics
         self.students_per_activity = students_per_activity
         self.days = days
         self.professors = professors
         self.chosen_assignment = chosen_assignment
+
+        if profs_assignments is None:
+            profs_assignments = self.build_profs_assignments()
         self.profs_assignments = profs_assignments
 
-    def get_next_states(self):
-        """Returns a list of next states for the current node with added randomness for diversity."""
-        next_states = []
+        # Professors and activities already present in every (day, interval) slot
+        if busy_profs is None or scheduled_activities is None:
+            busy_profs, scheduled_activities = self.build_slot_occupancy()
+        self.busy_profs = busy_profs
+        self.scheduled_activities = scheduled_activities
+
+        # Running totals (assignments, remaining students, soft violations, pause violations)
+        # which already account for the chosen assignment
+        if totals is None:
+            totals = self.compute_totals()
+        (
+            self.assignments_count,
+            self.remaining_students,
+            self.soft_violations,
+            self.pause_violations,
+        ) = totals
+
+        # Zobrist hash of the timetable, it also accounts for the chosen assignment
+        if zobrist_hash is None:
+            zobrist_hash = self.compute_zobrist_hash()
+        self.zobrist_hash = zobrist_hash
+
+    def build_profs_assignments(self):
+        """Returns the sorted (day, interval) slots of every professor in the timetable"""
+        if isinstance(self.days, TimetableGrid):
+            return self.days.profs_assignments()
+
+        profs_assignments = {}
+        for day_name, intervals in self.days.items():
+            for interval_tuple, assignments in intervals.items():
+                for _, assignment in assignments.items():
+                    if assignment:
+                        profs_assignments.setdefault(assignment[0], []).append(
+                            (day_name, interval_tuple)
+                        )
+
+        for slots in profs_assignments.values():
+            slots.sort()
+        return profs_assignments
+
+    def build_slot_occupancy(self):
+        """Returns the sets of busy professors and scheduled activities of every (day, interval) slot"""
+        if isinstance(self.days, TimetableGrid):
+            return self.days.slot_occupancy()
+
+        busy_profs = {}
+        scheduled_activities = {}
+        for day_name, intervals in self.days.items():
+            for interval_tuple, assignments in intervals.items():
+                slot = (day_name, interval_tuple)
+                busy_profs[slot] = set()
+                scheduled_activities[slot] = set()
+                for _, assignment in assignments.items():
+                    if assignment:
+                        busy_profs[slot].add(assignment[0])
+                        scheduled_activities[slot].add(assignment[1])
+
+        return busy_profs, scheduled_activities
+
+    def compute_totals(self):
+        """Computes the running totals of the current node with a full pass over the timetable"""
+        assignments_count = 0
+        soft_violated = 0
+        pause_violated = 0
+
+        if isinstance(self.days, TimetableGrid):
+            # Whole grid reductions instead of a walk over every cell
+            assignments_count = self.days.number_of_assignments()
+            soft_violated = self.days.soft_violations()
+        else:
+            for day_name, intervals in self.days.items():
+                for interval_tuple, assignments in intervals.items():
+                    for _, assignment in assignments.items():
+                        if assignment:
+                            assignments_count += 1
+                            soft_violated += self.slot_penalty(
+                                day_name, interval_tuple, assignment[0]
+                            )
+
+        for prof, slots in self.profs_assignments.items():
+            pause_violated += self.pause_violations_of(prof, slots)
+
+        # Make one more step for the chosen assignment if it is not applied yet
+        if self.chosen_assignment:
+            day, interval, space, prof, _ = self.chosen_assignment
+            if not self.days[day][interval][space]:
+                assignments_count += 1
+                number, number_p = self.number_of_constrains_violated(
+                    day, interval, prof
+                )
+                soft_violated += number
+                pause_violated += number_p
+
+        return (
+            assignments_count,
+            sum(self.students_per_activity.values()),
+            soft_violated,
+            pause_violated,
+        )
+
+    def compute_zobrist_hash(self):
+        """Computes the Zobrist hash of the current node with a full pass over the timetable"""
+        zobrist_hash = 0
+        if isinstance(self.days, TimetableGrid):
+            constraints_manager = self.constraints_manager
+            intervals_count = len(constraints_manager.intervals)
+            rooms_count = len(constraints_manager.rooms)
+            for day_id, interval_id, room_id, prof_id, activity_id in zip(
+                *(ids.tolist() for ids in self.days.occupied_cells())
+            ):
+                cell = (day_id * intervals_count + interval_id) * rooms_count + room_id
+                zobrist_hash ^= constraints_manager.zobrist_cell_key(
+                    cell, prof_id, activity_id
+                )
+        else:
+            for day_name, intervals in self.days.items():
+                for interval_tuple, assignments in intervals.items():
+                    for place, assignment in assignments.items():
+                        if assignment:
+                            zobrist_hash ^= self.constraints_manager.zobrist_key(
+                                day_name, interval_tuple, place, *assignment
+                            )
+
+        # Make one more step for the chosen assignment if it is not applied yet
+        if self.chosen_assignment:
+            day, interval, space, prof, activity = self.chosen_assignment
+            if not self.days[day][interval][space]:
+                zobrist_hash ^= self.constraints_manager.zobrist_key(
+                    day, interval, space, prof, activity
+                )
+
+        return zobrist_hash
+
+    def move_hash(self, move: Move):
+        """Returns the Zobrist hash of the node the move would lead to"""
+        return self.zobrist_hash ^ self.constraints_manager.zobrist_key(
+            move.day, move.interval, move.room, move.prof, move.activity
+        )
+
+    def get_totals(self):
+        """Returns the running totals of the current node"""
+        return (
+            self.assignments_count,
+            self.remaining_students,
+            self.soft_violations,
+            self.pause_violations,
+        )
+
+    def get_next_moves(self):
+        """Returns a list of moves from the current node with added randomness for diversity."""
+        next_moves = []
         for day_name, intervals in self.days.items():
             for interval_tuple, assignments in intervals.items():
                 for place, assignment in assignments.items():
                     if assignment == None:
-                        possible_states = self.apply_constraints_on_possible_states(
+                        possible_moves = self.apply_constraints_on_possible_moves(
                             day_name, interval_tuple, place
                         )
                         # Introduce a random selection element
                         if (
-                            random.random() < 0.1 and possible_states
+                            random.random() < 0.1 and possible_moves
                         ):  
                             # 10% chance to break the pattern
-                            random_choice = random.choice(possible_states)
-                            next_states.append(random_choice)
+                            random_choice = random.choice(possible_moves)
+                            next_moves.append(random_choice)
                         else:
-                            next_states.extend(possible_states)
+                            next_moves.extend(possible_moves)
 
-        return next_states
+        return next_moves
 
-    def apply_constraints_on_possible_states(self, day_name, interval_tuple, place):
-        """Returns a list of possible states for the current node"""
-        possible_states = []
+    def get_next_states(self):
+        """Returns a list of next states for the current node with added randomness for diversity."""
+        return [self.choose_move(move) for move in self.get_next_moves()]
+
+    def apply_constraints_on_possible_moves(self, day_name, interval_tuple, place):
+        """Returns a list of possible moves for the current node"""
+        possible_moves = []
 
         # Sort activities by the number of students needing assignment
         sorted_activities = sorted(
-            self.constraints_manager.constraints[SALI][place][MATERII],
+            self.constraints_manager.activities_per_room[place],
             key=lambda act: -self.students_per_activity[act],
         )
 
@@ -125,17 +500,17 @@ class TimetableNode:
         )
 
         # Then take the first activity that is not assigned
+        capacities = self.constraints_manager.room_capacities[place]
         for activity in sorted_activities:
             if self.students_per_activity[activity] > 0:
-                for prof, prof_constraints in self.constraints_manager.constraints[
-                    PROFESORI
-                ].items():
+                # Only the professors that teach the activity are candidates
+                for prof in self.constraints_manager.profs_per_activity[activity]:
+                    prof_constraints = self.constraints_manager.constraints[PROFESORI][
+                        prof
+                    ]
                     if self.check_constraint(
                         prof_constraints, day_name, interval_tuple, activity, prof
                     ):
-                        capacities = self.constraints_manager.constraints[SALI][place][
-                            CAPACITATE
-                        ]
                         parameters = (
                             day_name,
                             interval_tuple,
@@ -144,10 +519,18 @@ class TimetableNode:
                             activity,
                             capacities,
                         )
-                        new_spot = self.choose_interval(parameters)
-                        possible_states.append(new_spot)
+                        possible_moves.append(self.create_move(parameters))
 
-        return possible_states
+        return possible_moves
+
+    def apply_constraints_on_possible_states(self, day_name, interval_tuple, place):
+        """Returns a list of possible states for the current node"""
+        return [
+            self.choose_move(move)
+            for move in self.apply_constraints_on_possible_moves(
+                day_name, interval_tuple, place
+            )
+        ]
 
     def check_constraint(
         self, constraints, day_name, interval_tuple, activity, profesor
@@ -155,66 +538,102 @@ class TimetableNode:
         """Returns True if the constraints are met, False otherwise"""
 
         # If day is not available
-        if day_name not in self.constraints_manager.constraints[ZILE]:
+        if day_name not in self.constraints_manager.day_ids:
             return False
 
-        # Professors can't have more than 7 activities
-        if self.professors[profesor] > 6:
+        # Professors can't have more than MAX_PROF_SLOTS activities
+        if self.professors[profesor] >= self.constraints_manager.MAX_PROF_SLOTS:
             return False
 
         # If activity is not in the constraints
-        if activity not in constraints[MATERII]:
+        if activity not in self.constraints_manager.activities_per_prof[profesor]:
             return False
 
         # If professor is already assigned to an activity in the same interval
-        for _, assignment in self.days[day_name][interval_tuple].items():
-            if assignment and assignment[0] == profesor:
-                return False
+        if profesor in self.busy_profs[(day_name, interval_tuple)]:
+            return False
 
         # If room is already used in that interval
-        for _, assignment in self.days[day_name][interval_tuple].items():
-            if assignment and assignment[1] == activity:
-                return False
+        if activity in self.scheduled_activities[(day_name, interval_tuple)]:
+            return False
 
         return True
 
-    def choose_interval(self, parameters):
-        """Returns a new node with the assignment chosen"""
+    def create_move(self, parameters):
+        """Returns the move that makes the given assignment, with its cost delta"""
         day_name, interval_tuple, space, prof, activity, capacity = parameters
-        assignment = (day_name, interval_tuple, space, prof, activity)
 
+        covered_students = min(capacity, self.students_per_activity[activity])
+        number, number_p = self.number_of_constrains_violated(
+            day_name, interval_tuple, prof
+        )
+
+        return Move(
+            day_name,
+            interval_tuple,
+            space,
+            prof,
+            activity,
+            covered_students,
+            number,
+            number_p,
+        )
+
+    def choose_move(self, move: Move):
+        """Returns a new node with the assignment of the move chosen"""
         new_student_per_activity = copy.copy(self.students_per_activity)
         new_professors = copy.copy(self.professors)
-        new_student_per_activity[activity] -= capacity
-
-        if new_student_per_activity[activity] < 0:
-            new_student_per_activity[activity] = 0
-        new_professors[prof] += 1
+        new_student_per_activity[move.activity] -= move.covered_students
+        new_professors[move.prof] += 1
+
+        # Update the running totals with the cost delta of the move only
+        totals = (
+            self.assignments_count + 1,
+            self.remaining_students - move.covered_students,
+            self.soft_violations + move.soft_delta,
+            self.pause_violations + move.pause_delta,
+        )
 
         new_node = TimetableNode(
             self.constraints_manager,
             new_student_per_activity,
             self.days,
             new_professors,
-            assignment,
+            move.assignment(),
+            self.profs_assignments,
+            totals,
+            self.busy_profs,
+            self.scheduled_activities,
+            self.move_hash(move),
+            self.metrics,
         )
 
         return new_node
 
+    def apply_move(self, move: Move):
+        """Returns an independent copy of this node with the move applied"""
+        new_node = self.choose_move(move).clone()
+        new_node.apply_assignment_on_best_node()
+        return new_node
+
+    def choose_interval(self, parameters):
+        """Returns a new node with the assignment chosen"""
+        return self.choose_move(self.create_move(parameters))
+
     def apply_assignment_on_best_node(self):
         """Applies the best assignment on the current node"""
         day, interval, space, prof, activity = self.chosen_assignment
         self.days[day][interval][space] = (prof, activity)
+        self.busy_profs[(day, interval)].add(prof)
+        self.scheduled_activities[(day, interval)].add(activity)
 
+        # Keep the professor's slots sorted by day and interval
         if prof not in self.profs_assignments:
             self.profs_assignments[prof] = []
-        self.profs_assignments[prof].append((day, interval))
-
-    def eval_node(self):
-        """Returns the evaluation of the current node for hill climbing with adjusted weights and penalties."""
-        remaining_students = self.get_remaining_students()
-        soft_violations, pause_violations = self.number_of_soft_restrictions_violated()
+        bisect.insort(self.profs_assignments[prof], (day, interval))
 
+    def evaluate(self, remaining_students, soft_violations, pause_violations):
+        """Returns the hill climbing evaluation for the given totals"""
         # Using exponential penalties for remaining students to ensure it's a priority
         student_penalty = (remaining_students**2) * 50
 
@@ -227,41 +646,98 @@ class TimetableNode:
 
         return student_penalty + constraint_penalty
 
-    def h(self):
-        '''Returns the heuristic value of the current node for A* search with adjusted weights and penalties.'''
+    def eval_move(self, move: Move):
+        """Returns the hill climbing evaluation of the node the move would lead to"""
+        return self.evaluate(
+            self.remaining_students - move.covered_students,
+            self.soft_violations + move.soft_delta,
+            self.pause_violations + move.pause_delta,
+        )
+
+    def eval_moves(self, moves: list[Move]):
+        """Returns the hill climbing evaluations of all the moves, computed in one vectorized pass.
+
+        The result matches [self.eval_move(move) for move in moves] exactly.
+        """
+        if np is None:
+            raise ImportError("Vectorized scoring requires numpy")
+
+        constraints_manager = self.constraints_manager
+        count = len(moves)
+
+        covered = np.fromiter((move.covered_students for move in moves), np.int64, count)
+        pause_deltas = np.fromiter((move.pause_delta for move in moves), np.int64, count)
+        prof_ids = np.fromiter(
+            (constraints_manager.prof_ids[move.prof] for move in moves), np.int64, count
+        )
+        slot_ids = np.fromiter(
+            (constraints_manager.slot_index[(move.day, move.interval)] for move in moves),
+            np.int64,
+            count,
+        )
+
+        # Soft violation deltas are gathered from the precomputed penalty table
+        soft_deltas = constraints_manager.penalty_array()[prof_ids, slot_ids]
+
+        remaining_students = self.remaining_students - covered
+        soft_violations = self.soft_violations + soft_deltas
+        pause_violations = self.pause_violations + pause_deltas
+
+        student_penalty = (remaining_students**2) * 50
+        constraint_penalty = np.where(
+            remaining_students
+            < constraints_manager.get_total_number_of_students() / 5,
+            soft_violations * 300000 + pause_violations * 1000,
+            soft_violations * 100000 + pause_violations * 200,
+        )
+
+        return student_penalty + constraint_penalty
+
+    def eval_node(self):
+        """Returns the evaluation of the current node for hill climbing with adjusted weights and penalties."""
+        return self.evaluate(
+            self.remaining_students, self.soft_violations, self.pause_violations
+        )
+
+    def heuristic(self, remaining_students, soft_violations, pause_violations):
+        '''Returns the A* heuristic value for the given totals'''
         # Impose a penalty for each student that is not assigned
         min_cost_per_student = 500
-        soft_violations, pause_violations = self.number_of_soft_restrictions_violated()
         return (
-            self.get_remaining_students() * min_cost_per_student
+            remaining_students * min_cost_per_student
             + 10000 * soft_violations
             + 1000 * pause_violations
         )
+
+    def cost_so_far(self, assignments_count):
+        '''Returns the A* cost for the given number of assignments'''
+        return 4000 * assignments_count
+
+    def h(self):
+        '''Returns the heuristic value of the current node for A* search with adjusted weights and penalties.'''
+        return self.heuristic(
+            self.remaining_students, self.soft_violations, self.pause_violations
+        )
         
     def g(self):
         '''Returns the cost of the current node for A* search with adjusted weights and penalties.'''
-        return (
-            4000 * self.number_of_assignments()
-        )
+        return self.cost_so_far(self.assignments_count)
 
     def total_cost(self):
         '''Returns the total cost of the current node for A* search with adjusted weights and penalties.'''
         return self.g() + self.h()
 
+    def move_total_cost(self, move: Move):
+        '''Returns the A* total cost of the node the move would lead to'''
+        return self.cost_so_far(self.assignments_count + 1) + self.heuristic(
+            self.remaining_students - move.covered_students,
+            self.soft_violations + move.soft_delta,
+            self.pause_violations + move.pause_delta,
+        )
+
     def number_of_assignments(self):
         """Returns the number of assignments in the current node"""
-        number = 0
-        for _, intervals in self.days.items():
-            for _, assignments in intervals.items():
-                for _, assignment in assignments.items():
-                    if assignment:
-                        number += 1
-
-        # Make one more step for the chosen assignment
-        if self.chosen_assignment:
-            number += 1
-
-        return number
+        return self.assignments_count
 
     def __lt__(self, other):
         '''Custom comparison for heapq'''
@@ -272,82 +748,67 @@ class TimetableNode:
 
     def __eq__(self, value: object) -> bool:
         '''Custom equality for closed set in A* search'''
-        # Check if the days dict is the same
-        return self.days == value.days
+        # Two nodes are the same timetable if their Zobrist hashes are the same
+        return self.zobrist_hash == value.zobrist_hash
 
     def __hash__(self) -> int:
         """Custom hash function for heapq"""
-        return hash(str(self.days))
+        return self.zobrist_hash
 
     def get_remaining_students(self):
         """Returns the number of remaining students to be assigned"""
-        return sum(self.students_per_activity.values())
+        return self.remaining_students
 
     def number_of_soft_restrictions_violated(self):
         """Returns the number of soft restrictions violated and pause violations for the current node"""
-        soft_violated = 0
-        pause_violated = 0
+        return self.soft_violations, self.pause_violations
 
-        for day_name, intervals in self.days.items():
-            for interval_tuple, assignments in intervals.items():
-                for _, assignment in assignments.items():
-                    if assignment:
-                        prof = assignment[0]
-                        number, number_p = self.number_of_constrains_violated(
-                            day_name, interval_tuple, prof
-                        )
-                        soft_violated += number
-                        pause_violated += number_p
+    def slot_penalty(self, day_name, interval_tuple, prof):
+        """Returns the day and interval penalty of a professor teaching in a given interval and day"""
+        prof_constraints = self.constraints_manager.professor_constraints[prof]
+        slot_idx = self.constraints_manager.slot_index[(day_name, interval_tuple)]
 
-        # Make one more step for the chosen assignment
-        if self.chosen_assignment:
-            prof = self.chosen_assignment[3]
-            number, number_p = self.number_of_constrains_violated(
-                self.chosen_assignment[0], self.chosen_assignment[1], prof
-            )
-            soft_violated += number
-            pause_violated += number_p
+        if prof_constraints.is_forbidden(slot_idx):
+            return prof_constraints.slot_penalties[slot_idx]
+        return 0
 
-        return soft_violated, pause_violated
+    def pause_violations_of(self, prof, slots):
+        """Returns the number of pause violations of a professor teaching in the given sorted slots"""
+        max_pause = self.constraints_manager.professor_constraints[prof].max_pause
+        if max_pause is None or not slots:
+            return 0
+        return count_pause_violations(max_pause, slots)
 
     def number_of_constrains_violated(self, day_name, interval_tuple, prof):
-        '''Returns the number of constraints violated for a professor in a given interval and day'''
-        number = 0
+        '''Returns the number of constraints violated by adding a professor in a given interval and day'''
+        number = self.slot_penalty(day_name, interval_tuple, prof)
+
+        # Pause not preferred constraint, only the pauses of this professor change
         number_of_pause_constrains_violated = 0
-        prof_constraints = self.constraints_manager.constraints[PROFESORI][prof][
-            CONSTRANGERI
-        ]
+        if self.constraints_manager.professor_constraints[prof].max_pause is not None:
+            slots = self.profs_assignments.get(prof, [])
+            new_slots = sorted(slots + [(day_name, interval_tuple)])
+            number_of_pause_constrains_violated = self.pause_violations_of(
+                prof, new_slots
+            ) - self.pause_violations_of(prof, slots)
 
-        if prof not in self.profs_assignments:
-            self.profs_assignments[prof] = []
-        self.profs_assignments[prof].append((day_name, interval_tuple))
-
-        for constraint in prof_constraints:
-            if "!" in constraint:
-                # Interval not preferred constraint
-                if "-" in constraint:
-                    # Break the interval into start and end
-                    start, end = constraint.split("-")
-                    start = start[1:]
-                    start = int(start)
-                    end = int(end)
-                    if start <= interval_tuple[0] <= interval_tuple[1] <= end:
-                        # Smaller cost for a interval constraint
-                        number += 1
-                # Pause not preferred constraint
-                elif ">" in constraint:
-                    # Sort the assignments by day and interval
-                    self.profs_assignments[prof].sort(key=lambda x: (x[0], x[1]))
-                    number_of_pause_constrains_violated += count_pause_violations(
-                        int(constraint.split()[2]), self.profs_assignments[prof]
-                    )
-                # Day not preferred constraint
-                else:
-                    if day_name in constraint:
-                        # Bigger cost for a day constraint
-                        number += 3
         return number, number_of_pause_constrains_violated
 
+    def state(self):
+        """Returns the constructor arguments of this node after its constraints manager,
+        to send the node to a process that already has the manager"""
+        return (
+            self.students_per_activity,
+            self.days,
+            self.professors,
+            self.chosen_assignment,
+            self.profs_assignments,
+            self.get_totals(),
+            self.busy_profs,
+            self.scheduled_activities,
+            self.zobrist_hash,
+        )
+
     def clone(self):
         """Creates a deep copy of this TimetableNode"""
         # Deep copy ensures that all dicts and lists are new objects
@@ -356,6 +817,11 @@ class TimetableNode:
         new_professors = copy.deepcopy(self.professors)
         new_chosen_assignment = copy.deepcopy(self.chosen_assignment)
         new_profs_assignments = copy.deepcopy(self.profs_assignments)
+        new_busy_profs = {slot: set(profs) for slot, profs in self.busy_profs.items()}
+        new_scheduled_activities = {
+            slot: set(activities)
+            for slot, activities in self.scheduled_activities.items()
+        }
 
         # Create a new instance of TimetableNode with the copied data
         return TimetableNode(
@@ -365,4 +831,14 @@ class TimetableNode:
             new_professors,
             new_chosen_assignment,
             new_profs_assignments,
+            self.get_totals(),
+            new_busy_profs,
+            new_scheduled_activities,
+            self.zobrist_hash,
+            self.metrics,
         )
+
+
+def instrument_timetable_node():
+    """Times the hot TimetableNode methods into the metrics of their search"""
+    instrument(TimetableNode, INSTRUMENTED_METHODS)
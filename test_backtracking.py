@@ -0,0 +1,27 @@
+from algorithms import BacktrackingSearch
+from generate_instance import generate_instance
+from orar import create_initial_node
+from search_log import SearchLog
+from structs import ConstraintManager
+from utils import MATERII
+
+
+def solve_generated_instance(seed, number_of_profs=2, number_of_rooms=5):
+    '''Runs the backtracking search on a generated exact instance, returns the number of students not assigned'''
+    instance, _ = generate_instance(
+        number_of_profs=number_of_profs, number_of_rooms=number_of_rooms, seed=seed
+    )
+    constraints_manager = ConstraintManager(instance, sum(instance[MATERII].values()))
+    initial_node = create_initial_node(instance, False, constraints_manager)
+    search = BacktrackingSearch(initial_node, time_limit=60, log=SearchLog("quiet"))
+    return search.search().get_remaining_students()
+
+
+def test_backtracking_solves_generated_instances():
+    # Exact instances have a hidden timetable seating every student
+    for seed in (4, 11, 24, 40):
+        assert solve_generated_instance(seed) == 0
+
+
+def test_backtracking_solves_tight_generated_instances():
+    assert solve_generated_instance(19, number_of_profs=3) == 0
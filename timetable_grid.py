@@ -0,0 +1,250 @@
+from collections.abc import Mapping
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Value of an empty cell in the grid
+EMPTY = -1
+PROF = 0
+ACTIVITY = 1
+
+
+class TimetableGrid(Mapping):
+    """Compact timetable stored as a NumPy int array indexed [day, interval, room, (prof, activity)].
+
+    It can be read like the nested days dictionary built by `orar.create_days_dict`
+    (timetable[day][interval][room] -> (prof, activity) or None), so it can be
+    used in place of it by TimetableNode, pretty_print_timetable and check_constraints.
+    """
+
+    def __init__(self, constraints_manager, cells=None):
+        """Constructor for the TimetableGrid class"""
+        if np is None:
+            raise ImportError("The array backed timetable requires numpy")
+
+        self.constraints_manager = constraints_manager
+        if cells is None:
+            shape = (
+                len(constraints_manager.days),
+                len(constraints_manager.intervals),
+                len(constraints_manager.rooms),
+                2,
+            )
+            cells = np.full(shape, EMPTY, dtype=np.int32)
+        self.cells = cells
+
+    def __getitem__(self, day_name):
+        return _IntervalsView(self, self.constraints_manager.day_ids[day_name])
+
+    def __iter__(self):
+        return iter(self.constraints_manager.days)
+
+    def __len__(self):
+        return len(self.constraints_manager.days)
+
+    def __contains__(self, day_name):
+        return day_name in self.constraints_manager.day_ids
+
+    def __eq__(self, other):
+        if isinstance(other, TimetableGrid):
+            return np.array_equal(self.cells, other.cells)
+        return Mapping.__eq__(self, other)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def copy(self):
+        """Returns a copy of the grid, the constraints manager is shared"""
+        return TimetableGrid(self.constraints_manager, self.cells.copy())
+
+    def get_cell(self, day_idx, interval_idx, room_idx):
+        """Returns the (prof, activity) names assigned in a cell or None if it is empty"""
+        prof_id, activity_id = self.cells[day_idx, interval_idx, room_idx]
+        if prof_id == EMPTY:
+            return None
+        return (
+            self.constraints_manager.profs[prof_id],
+            self.constraints_manager.activities[activity_id],
+        )
+
+    def set_cell(self, day_idx, interval_idx, room_idx, assignment):
+        """Assigns a (prof, activity) pair to a cell, None empties the cell"""
+        if assignment is None:
+            self.cells[day_idx, interval_idx, room_idx] = EMPTY
+            return
+
+        prof, activity = assignment
+        self.cells[day_idx, interval_idx, room_idx, PROF] = (
+            self.constraints_manager.prof_ids[prof]
+        )
+        self.cells[day_idx, interval_idx, room_idx, ACTIVITY] = (
+            self.constraints_manager.activity_ids[activity]
+        )
+
+    def to_dict(self):
+        """Returns the timetable as the nested days dictionary"""
+        return {
+            day_name: {
+                interval_tuple: dict(rooms.items())
+                for interval_tuple, rooms in intervals.items()
+            }
+            for day_name, intervals in self.items()
+        }
+
+    def occupied(self):
+        """Returns a boolean array [day, interval, room] of the occupied cells"""
+        return self.cells[..., PROF] != EMPTY
+
+    def occupied_cells(self):
+        """Returns the day, interval, room, professor and activity IDs of the occupied cells, as arrays"""
+        day_idx, interval_idx, room_idx = np.nonzero(self.occupied())
+        assignments = self.cells[day_idx, interval_idx, room_idx]
+        return (
+            day_idx,
+            interval_idx,
+            room_idx,
+            assignments[:, PROF],
+            assignments[:, ACTIVITY],
+        )
+
+    def profs_assignments(self):
+        """Returns the sorted (day, interval) slots of every professor, like TimetableNode.build_profs_assignments"""
+        constraints_manager = self.constraints_manager
+        day_idx, interval_idx, _, prof_ids, _ = self.occupied_cells()
+
+        profs_assignments = {}
+        for day_id, interval_id, prof_id in zip(
+            day_idx.tolist(), interval_idx.tolist(), prof_ids.tolist()
+        ):
+            profs_assignments.setdefault(constraints_manager.profs[prof_id], []).append(
+                (
+                    constraints_manager.days[day_id],
+                    constraints_manager.intervals[interval_id],
+                )
+            )
+
+        for slots in profs_assignments.values():
+            slots.sort()
+        return profs_assignments
+
+    def slot_occupancy(self):
+        """Returns the sets of busy professors and scheduled activities of every slot, like TimetableNode.build_slot_occupancy"""
+        constraints_manager = self.constraints_manager
+        busy_profs = {slot: set() for slot in constraints_manager.slots}
+        scheduled_activities = {slot: set() for slot in constraints_manager.slots}
+
+        day_idx, interval_idx, _, prof_ids, activity_ids = self.occupied_cells()
+        for day_id, interval_id, prof_id, activity_id in zip(
+            day_idx.tolist(),
+            interval_idx.tolist(),
+            prof_ids.tolist(),
+            activity_ids.tolist(),
+        ):
+            slot = (
+                constraints_manager.days[day_id],
+                constraints_manager.intervals[interval_id],
+            )
+            busy_profs[slot].add(constraints_manager.profs[prof_id])
+            scheduled_activities[slot].add(constraints_manager.activities[activity_id])
+
+        return busy_profs, scheduled_activities
+
+    def number_of_assignments(self):
+        """Returns the number of occupied cells"""
+        return int(np.count_nonzero(self.occupied()))
+
+    def professor_load(self):
+        """Returns the number of slots taught by every professor, indexed by professor ID"""
+        prof_ids = self.cells[..., PROF]
+        return np.bincount(
+            prof_ids[prof_ids != EMPTY], minlength=len(self.constraints_manager.profs)
+        )
+
+    def covered_students(self):
+        """Returns the number of students covered for every activity, indexed by activity ID"""
+        capacities = np.array(
+            [
+                self.constraints_manager.room_capacities[room]
+                for room in self.constraints_manager.rooms
+            ]
+        )
+        occupied = self.occupied()
+        activity_ids = self.cells[..., ACTIVITY][occupied]
+        room_capacities = np.broadcast_to(capacities, occupied.shape)[occupied]
+        return np.bincount(
+            activity_ids,
+            weights=room_capacities,
+            minlength=len(self.constraints_manager.activities),
+        ).astype(int)
+
+    def soft_violations(self):
+        """Returns the sum of the day and interval penalties of every assignment"""
+        penalties = self.constraints_manager.penalty_array()
+        occupied = self.occupied()
+        slot_ids = np.arange(len(self.constraints_manager.slots)).reshape(
+            occupied.shape[:2]
+        )
+        slot_ids = np.broadcast_to(slot_ids[..., None], occupied.shape)[occupied]
+        return int(penalties[self.cells[..., PROF][occupied], slot_ids].sum())
+
+
+class _IntervalsView(Mapping):
+    """Read/write view over the intervals of one day of a TimetableGrid"""
+
+    def __init__(self, grid, day_idx):
+        self.grid = grid
+        self.day_idx = day_idx
+
+    def __getitem__(self, interval_tuple):
+        return _RoomsView(
+            self.grid,
+            self.day_idx,
+            self.grid.constraints_manager.interval_ids[interval_tuple],
+        )
+
+    def __iter__(self):
+        return iter(self.grid.constraints_manager.intervals)
+
+    def __len__(self):
+        return len(self.grid.constraints_manager.intervals)
+
+    def __contains__(self, interval_tuple):
+        return interval_tuple in self.grid.constraints_manager.interval_ids
+
+
+class _RoomsView(Mapping):
+    """Read/write view over the rooms of one (day, interval) slot of a TimetableGrid"""
+
+    def __init__(self, grid, day_idx, interval_idx):
+        self.grid = grid
+        self.day_idx = day_idx
+        self.interval_idx = interval_idx
+
+    def __getitem__(self, room):
+        return self.grid.get_cell(
+            self.day_idx,
+            self.interval_idx,
+            self.grid.constraints_manager.room_ids[room],
+        )
+
+    def __setitem__(self, room, assignment):
+        self.grid.set_cell(
+            self.day_idx,
+            self.interval_idx,
+            self.grid.constraints_manager.room_ids[room],
+            assignment,
+        )
+
+    def __iter__(self):
+        return iter(self.grid.constraints_manager.rooms)
+
+    def __len__(self):
+        return len(self.grid.constraints_manager.rooms)
+
+    def __contains__(self, room):
+        return room in self.grid.constraints_manager.room_ids
@@ -1,5 +1,9 @@
 import yaml
 import argparse
+import csv
+import io
+import json
+import os
 import sys
 
 ##################### MACROURI #####################
@@ -12,12 +16,27 @@ CAPACITATE = "Capacitate"
 CONSTRANGERI = "Constrangeri"
 
 
+# Loader-ul C (LibYAML) este mult mai rapid decât cel scris în Python, dacă este disponibil
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Fișierele deja citite de proces, după cale, dată a modificării și dimensiune
+_yaml_files = {}
+
+
 def read_yaml_file(file_path: str) -> dict:
     """
     Citeste un fișier yaml și returnează conținutul său sub formă de dicționar
+
+    Fiecare fișier este parsat o singură dată per proces, dicționarul returnat este partajat și nu trebuie modificat
     """
-    with open(file_path, "r") as file:
-        return yaml.safe_load(file)
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+    if key not in _yaml_files:
+        with open(file_path, "r") as file:
+            _yaml_files[key] = yaml.load(file, Loader=SafeLoader)
+
+    return _yaml_files[key]
 
 
 def acces_yaml_attributes(yaml_dict: dict):
@@ -95,118 +114,144 @@ def allign_string_with_spaces(
     return s
 
 
-def pretty_print_timetable_aux_zile(
-    timetable: {str: {(int, int): {str: (str, str)}}}, input_path: str
-) -> str:
+def timetable_by_days(timetable: dict) -> dict:
     """
-    Primește un dicționar ce are chei zilele, cu valori dicționare de intervale reprezentate ca tupluri de int-uri, cu valori dicționare de săli, cu valori tupluri (profesor, materie)
+    Primește un orar indexat fie după zile, fie după intervale (tupluri de int-uri)
 
-    Returnează un string formatat să arate asemenea unui tabel excel cu zilele pe linii, intervalele pe coloane și în intersecția acestora, ferestrele de 2 ore cu materiile alocate în fiecare sală fiecărui profesor
+    Returnează orarul indexat după zile, apoi intervale, apoi săli
     """
+    if not timetable or not isinstance(next(iter(timetable)), tuple):
+        return timetable
 
-    max_len = 30
+    days = {}
+    for interval, days_of_interval in timetable.items():
+        for day, classes in days_of_interval.items():
+            days.setdefault(day, {})[interval] = classes
+    return days
 
-    profs = read_yaml_file(input_path)[PROFESORI].keys()
-    profs_to_initials, _ = get_profs_initials(profs)
 
-    table_str = "|           Interval           |             Luni             |             Marti            |           Miercuri           |              Joi             |            Vineri            |\n"
+def write_timetable(timetable: dict, profs: list, file) -> None:
+    """
+    Primește un orar (dicționar de zile, intervale și săli cu tupluri (profesor, materie) sau None), lista profesorilor și un fișier deschis pentru scriere
 
-    no_classes = len(timetable["Luni"][(8, 10)])
+    Scrie direct în fișier tabelul cu intervalele pe linii și zilele pe coloane, pentru oricâte zile, intervale și săli
+    """
 
-    first_line_len = 187
-    delim = "-" * first_line_len + "\n"
-    table_str = table_str + delim
+    max_len = 30
 
-    for interval in timetable["Luni"]:
-        s_interval = "|"
+    timetable = timetable_by_days(timetable)
+    profs_to_initials, _ = get_profs_initials(profs)
 
-        crt_str = allign_string_with_spaces(
-            f"{interval[0]} - {interval[1]}", max_len, "center"
-        )
+    days = list(timetable)
+    intervals = list(timetable[days[0]])
+    classrooms = list(timetable[days[0]][intervals[0]])
 
-        s_interval += crt_str
+    file.write(
+        "|"
+        + allign_string_with_spaces("Interval", max_len, "center")
+        + "".join(
+            "|" + allign_string_with_spaces(day, max_len, "center") for day in days
+        )
+        + "|\n"
+    )
 
-        for class_idx in range(no_classes):
-            if class_idx != 0:
-                s_interval += f'|{30 * " "}'
+    delim = "-" * (1 + (len(days) + 1) * (max_len + 1)) + "\n"
+    file.write(delim)
 
-            for day in timetable:
-                classes = timetable[day][interval]
-                classroom = list(classes.keys())[class_idx]
+    # Textul unei celule depinde doar de sală și de alocare, se formatează o singură dată
+    cells = {}
+    empty_interval = "|" + max_len * " "
 
-                s_interval += "|"
+    for interval in intervals:
+        interval_classes = [timetable[day][interval] for day in days]
 
-                if not classes[classroom]:
-                    s_interval += allign_string_with_spaces(
-                        f"{classroom} - goala", max_len, "left"
-                    )
-                else:
-                    prof, subject = classes[classroom]
-                    s_interval += allign_string_with_spaces(
-                        f"{subject} : ({classroom} - {profs_to_initials[prof]})",
-                        max_len,
-                        "left",
+        for class_idx, classroom in enumerate(classrooms):
+            if class_idx == 0:
+                line = [
+                    "|"
+                    + allign_string_with_spaces(
+                        f"{interval[0]} - {interval[1]}", max_len, "center"
                     )
+                ]
+            else:
+                line = [empty_interval]
 
-            s_interval += "|\n"
-        table_str += s_interval + delim
+            for classes in interval_classes:
+                assignment = classes[classroom]
+                key = (classroom, assignment)
 
-    return table_str
+                if key not in cells:
+                    if not assignment:
+                        cell = f"{classroom} - goala"
+                    else:
+                        prof, subject = assignment
+                        cell = f"{subject} : ({classroom} - {profs_to_initials[prof]})"
+                    cells[key] = "|" + allign_string_with_spaces(cell, max_len, "left")
 
+                line.append(cells[key])
 
-def pretty_print_timetable_aux_intervale(
-    timetable: {(int, int): {str: {str: (str, str)}}}, input_path: str
-) -> str:
-    """
-    Primește un dicționar de intervale reprezentate ca tupluri de int-uri, cu valori dicționare de zile, cu valori dicționare de săli, cu valori tupluri (profesor, materie)
+            line.append("|\n")
+            file.write("".join(line))
 
-    Returnează un string formatat să arate asemenea unui tabel excel cu zilele pe linii, intervalele pe coloane și în intersecția acestora, ferestrele de 2 ore cu materiile alocate în fiecare sală fiecărui profesor
-    """
+        file.write(delim)
 
-    max_len = 30
-
-    profs = read_yaml_file(input_path)[PROFESORI].keys()
-    profs_to_initials, _ = get_profs_initials(profs)
-
-    table_str = "|           Interval           |             Luni             |             Marti            |           Miercuri           |              Joi             |            Vineri            |\n"
-
-    no_classes = len(timetable[(8, 10)]["Luni"])
 
-    first_line_len = 187
-    delim = "-" * first_line_len + "\n"
-    table_str = table_str + delim
-
-    for interval in timetable:
-        s_interval = "|" + allign_string_with_spaces(
-            f"{interval[0]} - {interval[1]}", max_len, "center"
-        )
-
-        for class_idx in range(no_classes):
-            if class_idx != 0:
-                s_interval += "|"
+def timetable_assignments(timetable: dict):
+    """
+    Primește un orar indexat după zile sau după intervale
 
-            for day in timetable[interval]:
-                classes = timetable[interval][day]
-                classroom = list(classes.keys())[class_idx]
+    Generează tupluri (zi, interval, sală, profesor, materie) pentru fiecare sală ocupată
+    """
+    for day, intervals in timetable_by_days(timetable).items():
+        for interval, classes in intervals.items():
+            for classroom, assignment in classes.items():
+                if assignment:
+                    prof, subject = assignment
+                    yield day, interval, classroom, prof, subject
 
-                s_interval += "|"
 
-                if not classes[classroom]:
-                    s_interval += allign_string_with_spaces(
-                        f"{classroom} - goala", max_len, "left"
-                    )
-                else:
-                    prof, subject = classes[classroom]
-                    s_interval += allign_string_with_spaces(
-                        f"{subject} : ({classroom} - {profs_to_initials[prof]})",
-                        max_len,
-                        "left",
-                    )
+def timetable_to_json(timetable: dict) -> dict:
+    """
+    Returnează orarul ca dicționar serializabil JSON: zilele, intervalele, sălile și lista alocărilor
+    """
+    timetable = timetable_by_days(timetable)
+    days = list(timetable)
+    intervals = list(timetable[days[0]])
+
+    return {
+        "days": days,
+        "intervals": [list(interval) for interval in intervals],
+        "rooms": list(timetable[days[0]][intervals[0]]),
+        "assignments": [
+            {
+                "day": day,
+                "interval": list(interval),
+                "room": classroom,
+                "professor": prof,
+                "subject": subject,
+            }
+            for day, interval, classroom, prof, subject in timetable_assignments(
+                timetable
+            )
+        ],
+    }
+
+
+def write_timetable_json(timetable: dict, file) -> None:
+    """
+    Scrie orarul în format JSON: zilele, intervalele, sălile și lista alocărilor
+    """
+    json.dump(timetable_to_json(timetable), file, ensure_ascii=False, indent=2)
 
-            s_interval += "|\n"
-        table_str += s_interval + delim
 
-    return table_str
+def write_timetable_csv(timetable: dict, file) -> None:
+    """
+    Scrie orarul în format CSV, câte o linie pentru fiecare sală ocupată
+    """
+    writer = csv.writer(file)
+    writer.writerow(["day", "start", "end", "room", "professor", "subject"])
+    for day, interval, classroom, prof, subject in timetable_assignments(timetable):
+        writer.writerow([day, interval[0], interval[1], classroom, prof, subject])
 
 
 def pretty_print_timetable(timetable: dict, input_path: str) -> str:
@@ -216,10 +261,9 @@ def pretty_print_timetable(timetable: dict, input_path: str) -> str:
 
     Pentru cazul în care o sală nu este ocupată la un moment de timp, se așteaptă 'None' în valoare, în loc de tuplu
     """
-    if "Luni" in timetable:
-        return pretty_print_timetable_aux_zile(timetable, input_path)
-    else:
-        return pretty_print_timetable_aux_intervale(timetable, input_path)
+    table = io.StringIO()
+    write_timetable(timetable, list(read_yaml_file(input_path)[PROFESORI]), table)
+    return table.getvalue()
 
 
 if __name__ == "__main__":